@@ -35,6 +35,53 @@
 
 Пример запуска: python life.py input.txt 20 result green
 
+Дополнительные ключи указываются в любом месте командной строки в виде --имя=значение:
+--engine - движок моделирования. list (по умолчанию) - поле хранится в двумерных списках и обрабатывается поклеточно; numpy - поле и возрасты хранятся в массивах
+NumPy, количество соседей и правила возраста вычисляются сразу для всего поля (требуется библиотека numpy); sparse - хранятся только живые клетки и их возрасты (словарь с ключами-координатами), на каждом шаге проверяются только
+живые клетки и их соседи, поэтому время шага зависит от количества живых клеток, а не от площади поля. Подходит для больших почти пустых полей. Результаты всех движков
+совпадают.
+hashlife - поле хранится в виде квадродерева с общими одинаковыми поддеревьями, результаты для поддеревьев запоминаются, и движок переходит сразу через 2^k поколений.
+Подходит для очень долгих запусков (миллионы поколений). Возраст клеток в этом режиме не отслеживается: все живые клетки изображаются базовым цветом. Поле считается
+бесконечным, в файлы сохраняется только область исходного поля, поэтому результаты совпадают с другими движками, пока колония не достигает краёв поля.
+parallel - поле разбивается на горизонтальные полосы, каждую полосу обрабатывает отдельный процесс; поле хранится в общей памяти, а соседние строки полос читаются
+после завершения предыдущего шага всеми процессами (требуется библиотека numpy). Результаты совпадают с движком numpy.
+tiles - поле разбивается на блоки 32x32, и на каждом шаге пересчитываются только блоки, в которых или рядом с которыми на предыдущем шаге изменилась хотя бы
+одна клетка; возраст клеток в неизменных блоках учитывается счётчиком блока (требуется библиотека numpy). Подходит для полей, большая часть которых уже стабилизировалась.
+--workers - количество процессов для движка parallel (по умолчанию - количество ядер процессора).
+--snapshots - номера поколений через запятую, для которых сохраняются результаты (по умолчанию - все поколения, для движка hashlife - начальное и последнее).
+Для движка hashlife хотя бы одно поколение из списка должно быть не больше количества поколений.
+--cache - максимальное количество записей в кэшах движка hashlife (по умолчанию 1048576), при переполнении кэш очищается.
+--writers - количество фоновых потоков для сохранения файлов (по умолчанию 2). Пока файлы одного поколения записываются, вычисляется следующее поколение; если
+запись отстаёт больше чем на 2 * writers поколений, моделирование ждёт. При значении 0 файлы сохраняются сразу после каждого шага.
+--output - формат результатов: files (по умолчанию) - файлы step_N.txt и step_N.png для каждого поколения; history - один файл history.life, в котором поля всех
+поколений хранятся упакованными по 1 биту на клетку и сжатыми, каждый кадр, кроме ключевых, хранит только отличия от предыдущего. Для чтения любого поколения из
+файла истории используется класс HistoryReader (возраст клеток в истории не хранится и восстанавливается по предыдущим поколениям).
+--animation=gif - дополнительно сохранить все поколения в анимированный файл animation.gif.
+--convert=<файл> - преобразовать входной файл в подготовленное поле (по 1 биту на клетку) и завершить работу. Подготовленное поле можно указывать вместо
+входного файла: оно отображается в память и не разбирается заново. Движки numpy, parallel и tiles читают входной файл построчно сразу в компактный массив
+(1 байт на клетку), не создавая списков; длина строк проверяется при чтении. Эти движки хранят и возраст клеток в 1 байте. Движки list,
+sparse и hashlife тоже принимают подготовленное поле, но распаковывают его в списки (требуется библиотека numpy).
+--cycles - поиск повторяющихся поколений по отпечаткам (хешам) полей последних 1000 поколений. Программа сообщает, что колония вымерла, стала устойчивой
+(still life) или повторяется с периодом p начиная с поколения g. report - только сообщить; stop - сообщить и завершить моделирование; fill - сообщить,
+вычислить ещё один период и сохранить оставшиеся поколения без моделирования, повторяя этот период. Движок hashlife не поддерживает поиск циклов.
+
+Пример запуска: python life.py input.txt 20 result green --engine=numpy
+Пример запуска: python life.py input.txt 1000000 result green --engine=hashlife --snapshots=0,1000,1000000
+Пример запуска: python life.py input.txt 10000 result green --engine=numpy --output=history --animation=gif
+Пример запуска: python life.py input.txt 100 result green --engine=parallel --workers=8
+Пример запуска: python life.py input.txt --convert=input.seed
+Пример запуска: python life.py --batch=jobs.csv --jobs=8 --summary=summary.csv --engine=numpy
+
+--profile=<файл> - записать в csv-файл время этапов (чтение поля, вычисление поколения, получение поля, запись текстового файла, построение изображения,
+запись истории и анимации) и пиковый объём памяти, выделенной во время этапов каждого поколения (в КБ, измеряется модулем tracemalloc и
+включает массивы NumPy; общая память движка parallel не учитывается). В пакетном режиме файл с этим именем создаётся в каталоге результатов
+каждого задания. При профилировании файлы сохраняются без фоновых потоков (как при --writers=0), чтобы пик памяти относился к одному
+поколению; отслеживание памяти замедляет моделирование (движок list - примерно на 40%).
+
+Пакетный режим: --batch=<файл> - csv-файл заданий со столбцами input, steps, output_dir, color (цвет можно не указывать). Задания выполняются в пуле из --jobs
+процессов (по умолчанию - количество ядер процессора), остальные ключи применяются ко всем заданиям. Для каждого задания в файл --summary (по умолчанию
+summary.csv) записываются время выполнения, количество живых клеток в начальном и последнем поколении и найденный цикл.
+
 Результат работы программы: в указанной папке создаются файлы для каждого шага моделирования: текстовое представление поля и изображение состояния поля (файл step_0 соответствует начальному состоянию).
 
 Перед запуском программы необходимо установить библиотеку pillow, подготовить входной текстовый файл с начальными данными, разместить файл программы и входной файл в одной папке (или указать полный путь к файлу
@@ -44,7 +91,25 @@
 
 import sys
 import os
-from PIL import Image
+import struct
+import zlib
+import hashlib
+import csv
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+import multiprocessing
+from multiprocessing import shared_memory
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from PIL import Image, GifImagePlugin
+
+# NumPy нужен только для векторизованного движка, поэтому импорт необязательный
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Словарь базовых цветов
 base_colors = {
@@ -59,15 +124,27 @@ cell_size = 20
 # Максимальный возраст, учитывающийся при вычислении оттенка
 max_age_color = 10
 
-# Чтение текстового файла и его преобразование
+# Возраст клеток в массивах NumPy хранится в одном байте и перестаёт расти на age_limit: для изображений
+# и истории важен только возраст до max_age_color, поэтому результаты не меняются
+age_limit = 255
+
+# Чтение текстового файла и его преобразование (подготовленное поле распаковывается в списки)
 def read_field(filename):
+    if is_seed(filename):
+        if np is None:
+            raise ValueError("для чтения подготовленного поля необходимо установить библиотеку numpy")
+        return read_seed(filename).tolist()
+
     f = open(filename, "r")
     field = []
 
-    for line in f:
+    for number, line in enumerate(f, 1):
         line = line.strip()
         if line == "":
             continue
+        if field and len(line) != len(field[0]):
+            f.close()
+            raise ValueError(f"строка {number} имеет длину {len(line)}, ожидалось {len(field[0])}")
         row = []
         for c in line:
             if c == "#":
@@ -77,19 +154,88 @@ def read_field(filename):
         field.append(row)
 
     f.close()
+    if not field:
+        raise ValueError("входной файл не содержит поля")
     return field
 
+# Таблица для преобразования байтов строки входного файла в клетки: "#" -> 1, остальные символы -> 0
+cell_bytes = bytes(1 if c == ord("#") else 0 for c in range(256))
+
+# Чтение текстового файла построчно сразу в массив NumPy (1 байт на клетку) без промежуточных списков.
+# Символы входного файла должны быть однобайтовыми (ASCII)
+def read_field_array(filename):
+    if is_seed(filename):
+        return read_seed(filename)
+
+    data = bytearray()
+    h = 0
+    w = None
+    with open(filename, "rb") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if w is None:
+                w = len(line)
+            elif len(line) != w:
+                raise ValueError(f"строка {number} имеет длину {len(line)}, ожидалось {w}")
+            data += line.translate(cell_bytes)
+            h += 1
+    if h == 0:
+        raise ValueError("входной файл не содержит поля")
+    return np.frombuffer(data, dtype=np.uint8).reshape(h, w)
+
+# Формат подготовленного начального поля: заголовок (сигнатура, h, w), затем строки поля,
+# упакованные по 1 биту на клетку (каждая строка дополняется нулями до целого числа байтов)
+seed_magic = b"LIFESEED"
+seed_header = struct.Struct("<8sII")
+
+# Количество строк, распаковываемых за один раз при чтении подготовленного поля
+seed_chunk_rows = 1024
+
+# Проверка, является ли файл подготовленным начальным полем
+def is_seed(filename):
+    with open(filename, "rb") as f:
+        return f.read(len(seed_magic)) == seed_magic
+
+# Преобразование текстового файла в подготовленное поле (файл читается построчно)
+def convert_seed(filename, seed_filename):
+    h = 0
+    w = None
+    with open(filename, "rb") as f, open(seed_filename, "wb") as out:
+        out.write(seed_header.pack(seed_magic, 0, 0))
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if w is None:
+                w = len(line)
+            elif len(line) != w:
+                raise ValueError(f"строка {number} имеет длину {len(line)}, ожидалось {w}")
+            out.write(np.packbits(np.frombuffer(line.translate(cell_bytes), dtype=np.uint8)).tobytes())
+            h += 1
+        if h == 0:
+            raise ValueError("входной файл не содержит поля")
+        out.seek(0)
+        out.write(seed_header.pack(seed_magic, h, w))
+
+# Чтение подготовленного поля: файл отображается в память и распаковывается частями по seed_chunk_rows строк
+def read_seed(filename):
+    with open(filename, "rb") as f:
+        magic, h, w = seed_header.unpack(f.read(seed_header.size))
+    packed = np.memmap(filename, dtype=np.uint8, mode="r", offset=seed_header.size, shape=(h, (w + 7) // 8))
+    field = np.empty((h, w), dtype=np.uint8)
+    for y in range(0, h, seed_chunk_rows):
+        field[y:y + seed_chunk_rows] = np.unpackbits(packed[y:y + seed_chunk_rows], axis=1, count=w)
+    del packed
+    return field
+
+
 # Запись поля в текстовый файл
 def write_field(field, filename):
     f = open(filename, "w")
     for row in field:
-        line = ""
-        for c in row:
-            if c > 0:
-                line += "#"
-            else:
-                line += "."
-        f.write(line + "\n")
+        f.write("".join("#" if c > 0 else "." for c in row) + "\n")
     f.close()
 
 # Подсчёт количества живых соседей, где x и y - координаты клетки
@@ -152,67 +298,1099 @@ def age_to_color(age, base_color):
         int(255 - (255 - b) * k)
     )
 
-# Сохранение изображения текущего состояния поля
+# Таблица цветов: индекс - возраст клетки (от 0 до max_age_color), значение - цвет в виде байтов RGB
+def color_table(base_color):
+    table = []
+    for age in range(max_age_color + 1):
+        table.append(bytes(age_to_color(age, base_color)))
+    return table
+
+# Сохранение изображения текущего состояния поля: сначала строится изображение, где каждой клетке
+# соответствует один пиксель, затем оно увеличивается до размера cell_size x cell_size на клетку
 def save_image(field, ages, filename, base_color, h, w):
-    img = Image.new(
-        "RGB",
-        (w * cell_size, h * cell_size),
-        (255, 255, 255)
+    table = color_table(base_color)
+
+    if np is not None and isinstance(field, np.ndarray):
+        lut = np.frombuffer(b"".join(table), dtype=np.uint8).reshape(-1, 3)
+        index = np.where(field > 0, np.clip(ages, 0, max_age_color), 0)
+        data = lut[index].tobytes()
+    else:
+        data = bytearray()
+        for y in range(h):
+            row_field = field[y]
+            row_ages = ages[y]
+            data += b"".join(
+                table[min(max(row_ages[x], 0), max_age_color)] if row_field[x] > 0 else table[0]
+                for x in range(w)
+            )
+
+    img = Image.frombytes("RGB", (w, h), bytes(data))
+    img = img.resize((w * cell_size, h * cell_size), Image.NEAREST)
+    img.save(filename)
+
+# Измерение времени этапов моделирования для каждого поколения. Если filename не задан, измерения не выполняются.
+# Таблица (поколение, время этапов в секундах, пиковый объём памяти) записывается в csv-файл при закрытии.
+# Память измеряется модулем tracemalloc (учитываются и массивы NumPy): после каждого этапа пик памяти за этап
+# добавляется к поколению и сбрасывается. Пик общий для процесса, поэтому он относится к одному поколению, только если
+# этапы разных поколений не выполняются одновременно (при профилировании run сохраняет файлы без фоновых потоков).
+# Отслеживание памяти замедляет выделение памяти, особенно в движках list и sparse; оно включается при первом измерении
+class PhaseProfiler:
+    phases = ["read", "step", "snapshot", "write_field", "save_image", "output"]
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.rows = {}
+        self.lock = threading.Lock()
+        self.started = False
+        self.tracing = False
+
+    def add(self, generation, phase, seconds):
+        with self.lock:
+            row = self.rows.setdefault(generation, {})
+            row[phase] = row.get(phase, 0) + seconds
+            peak = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.reset_peak()
+            row["peak_kb"] = max(row.get("peak_kb", 0), peak)
+
+    @contextmanager
+    def measure(self, generation, phase):
+        if self.filename is None:
+            yield
+            return
+        if not self.started:
+            self.started = True
+            self.tracing = not tracemalloc.is_tracing()
+            if self.tracing:
+                tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(generation, phase, time.perf_counter() - start)
+
+    def close(self):
+        if self.filename is None:
+            return
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+        with open(self.filename, "w", newline="", encoding="utf-8") as f:
+            table = csv.writer(f)
+            table.writerow(["generation"] + self.phases + ["peak_kb"])
+            for generation in sorted(self.rows):
+                row = self.rows[generation]
+                table.writerow(
+                    [generation]
+                    + [f"{row[phase]:.6f}" if phase in row else "" for phase in self.phases]
+                    + [row.get("peak_kb", "")]
+                )
+
+# Сохранение результатов одного поколения: текстовое представление поля и изображение
+def write_snapshot(field, ages, output_dir, generation, base_color, h, w, profiler):
+    with profiler.measure(generation, "write_field"):
+        write_field(field, os.path.join(output_dir, f"step_{generation}.txt"))
+    with profiler.measure(generation, "save_image"):
+        save_image(field, ages, os.path.join(output_dir, f"step_{generation}.png"), base_color, h, w)
+
+# Упаковка поля в байты: по 1 биту на клетку, каждая строка дополняется нулями до целого числа байтов
+def pack_field(field, h, w):
+    if np is not None and isinstance(field, np.ndarray):
+        return np.packbits(field > 0, axis=1).tobytes()
+    stride = (w + 7) // 8
+    pad = "0" * (stride * 8 - w)
+    data = bytearray()
+    for row in field:
+        bits = "".join("1" if c > 0 else "0" for c in row) + pad
+        data += int(bits, 2).to_bytes(stride, "big")
+    return bytes(data)
+
+# Распаковка поля из байтов в двумерный список
+def unpack_field(data, h, w):
+    stride = (w + 7) // 8
+    field = []
+    for y in range(h):
+        value = int.from_bytes(data[y * stride:(y + 1) * stride], "big")
+        bits = bin(value)[2:].zfill(stride * 8)
+        field.append([1 if c == "1" else 0 for c in bits[:w]])
+    return field
+
+# Побайтовое исключающее ИЛИ двух упакованных полей (разность соседних поколений)
+def xor_bytes(a, b):
+    return (int.from_bytes(a, "big") ^ int.from_bytes(b, "big")).to_bytes(len(a), "big")
+
+# Формат файла истории: заголовок (сигнатура, h, w), затем сжатые zlib кадры, затем таблица кадров
+# (поколение, смещение, длина, признак ключевого кадра) и в конце - смещение таблицы и количество кадров.
+# Ключевой кадр хранит упакованное поле целиком, остальные кадры - разность с предыдущим кадром
+history_magic = b"LIFEHIS1"
+history_header = struct.Struct("<8sII")
+history_entry = struct.Struct("<QQIB")
+history_footer = struct.Struct("<QQ")
+
+# Каждый history_keyframe_interval-й кадр сохраняется целиком, чтобы чтение любого поколения
+# требовало восстановления не более чем такого количества кадров
+history_keyframe_interval = 64
+
+# Запись всех поколений в один файл истории
+class HistoryWriter:
+    def __init__(self, filename, h, w):
+        self.h = h
+        self.w = w
+        self.f = open(filename, "wb")
+        self.f.write(history_header.pack(history_magic, h, w))
+        self.entries = []
+        self.previous = None
+
+    def add(self, field, ages, generation):
+        packed = pack_field(field, self.h, self.w)
+        key = len(self.entries) % history_keyframe_interval == 0
+        data = packed if key else xor_bytes(packed, self.previous)
+        self.previous = packed
+
+        compressed = zlib.compress(data)
+        self.entries.append((generation, self.f.tell(), len(compressed), int(key)))
+        self.f.write(compressed)
+
+    def close(self):
+        index_offset = self.f.tell()
+        for entry in self.entries:
+            self.f.write(history_entry.pack(*entry))
+        self.f.write(history_footer.pack(index_offset, len(self.entries)))
+        self.f.close()
+
+# Чтение файла истории: любое поколение восстанавливается от ближайшего предыдущего ключевого кадра
+class HistoryReader:
+    def __init__(self, filename):
+        self.f = open(filename, "rb")
+        magic, self.h, self.w = history_header.unpack(self.f.read(history_header.size))
+        if magic != history_magic:
+            raise ValueError(f"{filename} не является файлом истории")
+
+        self.f.seek(-history_footer.size, os.SEEK_END)
+        index_offset, count = history_footer.unpack(self.f.read(history_footer.size))
+        self.f.seek(index_offset)
+        table = self.f.read(count * history_entry.size)
+        self.entries = [history_entry.unpack_from(table, i * history_entry.size) for i in range(count)]
+        self.positions = {}
+        for i, entry in enumerate(self.entries):
+            self.positions[entry[0]] = i
+
+    # Номера сохранённых поколений
+    def generations(self):
+        return [entry[0] for entry in self.entries]
+
+    def read_packed(self, i):
+        start = i
+        while not self.entries[start][3]:
+            start -= 1
+        packed = None
+        for j in range(start, i + 1):
+            generation, offset, length, key = self.entries[j]
+            self.f.seek(offset)
+            data = zlib.decompress(self.f.read(length))
+            packed = data if key else xor_bytes(data, packed)
+        return packed
+
+    # Поле для поколения generation
+    def field(self, generation):
+        i = self.positions[generation]
+        return unpack_field(self.read_packed(i), self.h, self.w)
+
+    # Возрасты клеток для поколения generation. Возраст в файле не хранится и восстанавливается по предыдущим
+    # поколениям, поэтому он точен не дальше max_age_color поколений назад (этого достаточно для изображения)
+    # и только если предыдущие поколения сохранены подряд
+    def ages(self, generation):
+        field = self.field(generation)
+        ages = [row[:] for row in field]
+        alive = [row[:] for row in field]
+        for back in range(1, max_age_color):
+            if generation - back not in self.positions:
+                break
+            previous = self.field(generation - back)
+            for y in range(self.h):
+                for x in range(self.w):
+                    alive[y][x] = alive[y][x] & previous[y][x]
+                    ages[y][x] += alive[y][x]
+        return ages
+
+    def close(self):
+        self.f.close()
+
+# Размер одной клетки в анимации (в пикселях)
+animation_cell_size = 4
+
+# Длительность одного кадра анимации (в миллисекундах)
+animation_frame_duration = 100
+
+# Запись поколений в анимированный GIF: кадры кодируются и дописываются в файл по одному,
+# поэтому вся анимация не хранится в памяти
+class AnimationWriter:
+    def __init__(self, filename, base_color, h, w):
+        self.h = h
+        self.w = w
+        self.palette = b"".join(color_table(base_color))
+        self.f = open(filename, "wb")
+        self.started = False
+
+    def add(self, field, ages, generation):
+        if np is not None and isinstance(field, np.ndarray):
+            index = np.where(field > 0, np.clip(ages, 0, max_age_color), 0).astype(np.uint8).tobytes()
+        else:
+            index = bytearray()
+            for y in range(self.h):
+                index += bytes(
+                    min(max(ages[y][x], 0), max_age_color) if field[y][x] > 0 else 0
+                    for x in range(self.w)
+                )
+        img = Image.frombytes("P", (self.w, self.h), bytes(index))
+        img.putpalette(self.palette)
+        img = img.resize((self.w * animation_cell_size, self.h * animation_cell_size), Image.NEAREST)
+
+        if not self.started:
+            header, _ = GifImagePlugin.getheader(img, info={"loop": 0, "optimize": False})
+            for chunk in header:
+                self.f.write(chunk)
+            self.started = True
+        for chunk in GifImagePlugin.getdata(img, duration=animation_frame_duration):
+            self.f.write(chunk)
+
+    def close(self):
+        self.f.write(b";")
+        self.f.close()
+
+# Запись результатов в фоновых потоках: пока сохраняется одно поколение, вычисляется следующее.
+# Если в очереди уже 2 * workers поколений, моделирование ждёт завершения самой старой записи.
+# Файлы step_N сохраняются параллельно, а история и анимация - в отдельном потоке по порядку поколений
+class SnapshotWriter:
+    def __init__(self, output_dir, base_color, h, w, workers, output="files", animation=None, profiler=None):
+        self.profiler = profiler if profiler is not None else PhaseProfiler(None)
+        self.output_dir = output_dir
+        self.base_color = base_color
+        self.h = h
+        self.w = w
+        self.files = output == "files"
+        self.sinks = []
+        if output == "history":
+            self.sinks.append(HistoryWriter(os.path.join(output_dir, "history.life"), h, w))
+        if animation == "gif":
+            self.sinks.append(AnimationWriter(os.path.join(output_dir, "animation.gif"), base_color, h, w))
+
+        self.max_pending = workers * 2
+        self.pending = deque()
+        self.pool = ThreadPoolExecutor(max_workers=workers) if workers > 0 else None
+        self.sequential = ThreadPoolExecutor(max_workers=1) if workers > 0 else None
+
+    def add_to_sinks(self, field, ages, generation):
+        with self.profiler.measure(generation, "output"):
+            for sink in self.sinks:
+                sink.add(field, ages, generation)
+
+    def write(self, field, ages, generation):
+        args = (field, ages, self.output_dir, generation, self.base_color, self.h, self.w, self.profiler)
+        if self.pool is None:
+            if self.files:
+                write_snapshot(*args)
+            self.add_to_sinks(field, ages, generation)
+            return
+        while len(self.pending) >= self.max_pending:
+            self.pending.popleft().result()
+        if self.files:
+            self.pending.append(self.pool.submit(write_snapshot, *args))
+        if self.sinks:
+            self.pending.append(self.sequential.submit(self.add_to_sinks, field, ages, generation))
+
+    def close(self):
+        try:
+            while self.pending:
+                self.pending.popleft().result()
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown(cancel_futures=True)
+                self.sequential.shutdown(cancel_futures=True)
+            for sink in self.sinks:
+                sink.close()
+
+# Вычисление следующего поколения для поля в виде массивов NumPy
+def step_numpy(field, ages, h, w):
+    padded = np.zeros((h + 2, w + 2), dtype=np.uint8)
+    padded[1:-1, 1:-1] = field
+    return step_band(padded, ages, h, w)
+
+# Следующее поколение полосы из h строк: padded - полоса с одной дополнительной строкой (и столбцом)
+# с каждой стороны, содержащими соседей полосы или нули за краем поля
+def step_band(padded, ages, h, w):
+    neighbours = np.zeros((h, w), dtype=np.uint8)
+    for dy in (0, 1, 2):
+        for dx in (0, 1, 2):
+            if dx == 1 and dy == 1:
+                continue
+            neighbours += padded[dy:dy + h, dx:dx + w]
+
+    alive = padded[1:h + 1, 1:w + 1] > 0
+    new_alive = (neighbours == 3) | (alive & (neighbours == 2))
+    new_field = new_alive.astype(np.uint8)
+    # Возраст выжившей клетки растёт на 1 (не больше age_limit), новой - равен 1; временные массивы того же типа, что и ages
+    new_ages = np.minimum(ages, age_limit - 1)
+    new_ages += 1
+    new_ages = np.where(alive, new_ages, new_ages.dtype.type(1))
+    new_ages *= new_alive
+    return new_field, new_ages
+
+# Преобразование поля и возрастов из списков в массивы NumPy (возраст - 1 байт, не больше age_limit)
+def to_arrays(field, ages):
+    return np.asarray(field, dtype=np.uint8), np.minimum(np.asarray(ages), age_limit).astype(np.uint8)
+
+# Преобразование поля и возрастов в словарь живых клеток: (y, x) -> возраст
+def to_cells(field, ages):
+    cells = {}
+    for y in range(len(field)):
+        for x in range(len(field[y])):
+            if field[y][x] > 0:
+                cells[(y, x)] = ages[y][x]
+    return cells
+
+# Преобразование словаря живых клеток обратно в поле и возрасты
+def from_cells(cells, h, w):
+    field = [[0] * w for _ in range(h)]
+    ages = [[0] * w for _ in range(h)]
+    for (y, x), age in cells.items():
+        field[y][x] = 1
+        ages[y][x] = age
+    return field, ages
+
+# Вычисление следующего поколения для разреженного поля: проверяются только живые клетки и их соседи
+def step_sparse(cells, h, w):
+    neighbours = {}
+    for (y, x) in cells:
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                if dx == 0 and dy == 0:
+                    continue
+                ny = y + dy
+                nx = x + dx
+                if 0 <= nx < w and 0 <= ny < h:
+                    neighbours[(ny, nx)] = neighbours.get((ny, nx), 0) + 1
+
+    new_cells = {}
+    for cell, count in neighbours.items():
+        if count == 3:
+            new_cells[cell] = cells.get(cell, 0) + 1
+        elif count == 2 and cell in cells:
+            new_cells[cell] = cells[cell] + 1
+    return new_cells
+
+# Количество процессов для движка parallel
+parallel_workers = os.cpu_count() or 1
+
+# Массивы NumPy поверх блоков общей памяти: два поля с нулевой рамкой (текущее и следующее поколение)
+# и два массива возрастов
+def shared_arrays(blocks, h, w):
+    fields = [np.ndarray((h + 2, w + 2), dtype=np.uint8, buffer=blocks[i].buf) for i in (0, 1)]
+    ages = [np.ndarray((h, w), dtype=np.uint8, buffer=blocks[i].buf) for i in (2, 3)]
+    return fields, ages
+
+# Процесс движка parallel: на каждом шаге вычисляет строки [y0, y1) поля. Строки соседних полос
+# (по одной сверху и снизу) читаются из общей памяти после того, как все процессы закончили предыдущий шаг
+def parallel_worker(names, h, w, y0, y1, barrier, stop):
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    fields, ages = shared_arrays(blocks, h, w)
+    current = 0
+    while True:
+        barrier.wait()
+        if stop.value:
+            break
+        new_field, new_ages = step_band(fields[current][y0:y1 + 2], ages[current][y0:y1], y1 - y0, w)
+        fields[1 - current][y0 + 1:y1 + 1, 1:w + 1] = new_field
+        ages[1 - current][y0:y1] = new_ages
+        barrier.wait()
+        current = 1 - current
+    del fields, ages
+    for block in blocks:
+        block.close()
+
+# Состояние движка parallel: поле разбито на горизонтальные полосы, каждую обрабатывает свой процесс
+class ParallelField:
+    def __init__(self, field, ages):
+        field, ages = to_arrays(field, ages)
+        h, w = field.shape
+        workers = max(1, min(parallel_workers, h))
+
+        sizes = [(h + 2) * (w + 2)] * 2 + [h * w] * 2
+        self.blocks = [shared_memory.SharedMemory(create=True, size=max(size, 1)) for size in sizes]
+        self.fields, self.ages = shared_arrays(self.blocks, h, w)
+        for i in (0, 1):
+            self.fields[i][:] = 0
+        self.fields[0][1:-1, 1:-1] = field
+        self.ages[0][:] = ages
+        self.current = 0
+
+        context = multiprocessing.get_context()
+        self.barrier = context.Barrier(workers + 1)
+        self.stop = context.Value("b", 0)
+        self.processes = []
+        names = [block.name for block in self.blocks]
+        for i in range(workers):
+            y0 = h * i // workers
+            y1 = h * (i + 1) // workers
+            process = context.Process(
+                target=parallel_worker,
+                args=(names, h, w, y0, y1, self.barrier, self.stop),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+
+    def step(self):
+        self.barrier.wait()
+        self.barrier.wait()
+        self.current = 1 - self.current
+        return self
+
+    def snapshot(self):
+        return self.fields[self.current][1:-1, 1:-1].copy(), self.ages[self.current].copy()
+
+    def close(self):
+        self.stop.value = 1
+        self.barrier.wait()
+        for process in self.processes:
+            process.join()
+        del self.fields, self.ages
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+# Размер квадратного блока поля (в клетках) для движка tiles
+tile_size = 32
+
+# Возрасты ages (массив uint8), увеличенные на delta (число или массив) для живых клеток alive, не больше age_limit
+def saturate_ages(ages, alive, delta):
+    added = np.minimum(age_limit - ages, np.minimum(delta, age_limit).astype(np.uint8))
+    added *= alive.astype(bool)
+    added += ages
+    return added
+
+# Состояние движка tiles: поле разбито на блоки tile_size x tile_size. Блок пересчитывается, только если
+# на предыдущем шаге изменилась хотя бы одна клетка в нём или в соседних блоках; иначе его клетки не меняются.
+# Возраст живых клеток в неизменном блоке растёт на 1 за шаг, поэтому вместо обновления каждой клетки
+# увеличивается счётчик блока, который добавляется к возрастам при следующем пересчёте блока
+class TiledField:
+    def __init__(self, field, ages):
+        field, ages = to_arrays(field, ages)
+        self.h, self.w = field.shape
+        self.padded = np.zeros((self.h + 2, self.w + 2), dtype=np.uint8)
+        self.padded[1:-1, 1:-1] = field
+        self.ages = ages.copy()
+        th = (self.h + tile_size - 1) // tile_size
+        tw = (self.w + tile_size - 1) // tile_size
+        self.offsets = np.zeros((th, tw), dtype=np.int64)
+        self.dirty = np.ones((th, tw), dtype=bool)
+
+    # Блоки, которые нужно пересчитать: изменившиеся блоки и их соседи
+    def active_tiles(self):
+        th, tw = self.dirty.shape
+        padded = np.zeros((th + 2, tw + 2), dtype=bool)
+        padded[1:-1, 1:-1] = self.dirty
+        active = np.zeros((th, tw), dtype=bool)
+        for dy in (0, 1, 2):
+            for dx in (0, 1, 2):
+                active |= padded[dy:dy + th, dx:dx + tw]
+        return active
+
+    def step(self):
+        active = self.active_tiles()
+        results = []
+        for ty, tx in zip(*np.nonzero(active)):
+            y0 = ty * tile_size
+            x0 = tx * tile_size
+            y1 = min(y0 + tile_size, self.h)
+            x1 = min(x0 + tile_size, self.w)
+            region = self.padded[y0:y1 + 2, x0:x1 + 2]
+            tile_ages = self.ages[y0:y1, x0:x1]
+            if self.offsets[ty, tx]:
+                tile_ages[:] = saturate_ages(tile_ages, region[1:-1, 1:-1], self.offsets[ty, tx])
+            self.offsets[ty, tx] = 0
+            new_field, new_ages = step_band(region, tile_ages, y1 - y0, x1 - x0)
+            changed = bool((new_field != region[1:-1, 1:-1]).any())
+            results.append((ty, tx, y0, y1, x0, x1, new_field, new_ages, changed))
+
+        # Блоки записываются только после вычисления всех блоков, так как соседние блоки читают старое поле
+        self.offsets[~active] += 1
+        self.dirty[:] = False
+        for ty, tx, y0, y1, x0, x1, new_field, new_ages, changed in results:
+            self.padded[y0 + 1:y1 + 1, x0 + 1:x1 + 1] = new_field
+            self.ages[y0:y1, x0:x1] = new_ages
+            self.dirty[ty, tx] = changed
+        return self
+
+    def snapshot(self):
+        field = self.padded[1:-1, 1:-1].copy()
+        offsets = np.minimum(self.offsets, age_limit).astype(np.uint8)
+        offsets = np.repeat(np.repeat(offsets, tile_size, axis=0), tile_size, axis=1)
+        ages = saturate_ages(self.ages, field, offsets[:self.h, :self.w])
+        return field, ages
+
+# Движки моделирования: имя -> (подготовка состояния из поля и возрастов, вычисление следующего поколения,
+# получение поля и возрастов из состояния для сохранения результатов, освобождение ресурсов)
+engines = {
+    "list": (
+        lambda field, ages: (field, ages),
+        lambda state, h, w: step(state[0], state[1], h, w),
+        lambda state, h, w: state,
+        lambda state: None
+    ),
+    "numpy": (
+        to_arrays,
+        lambda state, h, w: step_numpy(state[0], state[1], h, w),
+        lambda state, h, w: state,
+        lambda state: None
+    ),
+    "sparse": (to_cells, step_sparse, from_cells, lambda state: None),
+    "parallel": (
+        ParallelField,
+        lambda state, h, w: state.step(),
+        lambda state, h, w: state.snapshot(),
+        lambda state: state.close()
+    ),
+    "tiles": (
+        TiledField,
+        lambda state, h, w: state.step(),
+        lambda state, h, w: state.snapshot(),
+        lambda state: None
     )
-    pixels = img.load()
+}
+
+# Hashlife: поле хранится в виде квадродерева, одинаковые поддеревья хранятся в одном экземпляре,
+# а результаты вычисления будущих поколений для каждого узла запоминаются
+class Node:
+    __slots__ = ("k", "a", "b", "c", "d", "n", "hash")
+
+    def __init__(self, k, a, b, c, d, n, hash_value):
+        self.k = k  # уровень узла: сторона квадрата равна 2^k клеток
+        self.a = a  # северо-западная четверть
+        self.b = b  # северо-восточная четверть
+        self.c = c  # юго-западная четверть
+        self.d = d  # юго-восточная четверть
+        self.n = n  # количество живых клеток
+        self.hash = hash_value
+
+    def __hash__(self):
+        return self.hash
+
+# Листья квадродерева - живая и мёртвая клетка
+hashlife_on = Node(0, None, None, None, None, 1, 1)
+hashlife_off = Node(0, None, None, None, None, 0, 0)
+
+# Максимальное количество записей в кэшах Hashlife; при переполнении кэш очищается
+hashlife_cache_size = 2 ** 20
+
+# Кэш узлов: (a, b, c, d) -> узел, и кэш результатов: (узел, j) -> центр узла через 2^j поколений
+hashlife_nodes = {}
+hashlife_results = {}
+
+# Получение узла из четырёх четвертей (одинаковые узлы создаются один раз)
+def join(a, b, c, d):
+    key = (a, b, c, d)
+    node = hashlife_nodes.get(key)
+    if node is None:
+        if len(hashlife_nodes) >= hashlife_cache_size:
+            hashlife_nodes.clear()
+        hash_value = hash((a.k + 1, a.hash, b.hash, c.hash, d.hash))
+        node = Node(a.k + 1, a, b, c, d, a.n + b.n + c.n + d.n, hash_value)
+        hashlife_nodes[key] = node
+    return node
+
+# Пустой узел уровня k
+def empty(k):
+    if k == 0:
+        return hashlife_off
+    e = empty(k - 1)
+    return join(e, e, e, e)
+
+# Узел уровня k + 1, в центре которого находится исходный узел
+def centre(m):
+    e = empty(m.k - 1)
+    return join(
+        join(e, e, e, m.a),
+        join(e, e, m.b, e),
+        join(e, m.c, e, e),
+        join(m.d, e, e, e)
+    )
+
+# Следующее поколение центральных 2x2 клеток узла 4x4
+def life_4x4(m):
+    rows = [
+        [m.a.a, m.a.b, m.b.a, m.b.b],
+        [m.a.c, m.a.d, m.b.c, m.b.d],
+        [m.c.a, m.c.b, m.d.a, m.d.b],
+        [m.c.c, m.c.d, m.d.c, m.d.d]
+    ]
+    g = [[cell.n for cell in row] for row in rows]
+
+    def next_cell(y, x):
+        neighbours = -g[y][x]
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                neighbours += g[y + dy][x + dx]
+        if neighbours == 3 or (g[y][x] > 0 and neighbours == 2):
+            return hashlife_on
+        return hashlife_off
+
+    return join(next_cell(1, 1), next_cell(1, 2), next_cell(2, 1), next_cell(2, 2))
+
+# Центр узла уровня k (сторона 2^(k-1)) через 2^j поколений, j <= k - 2
+def successor(m, j):
+    key = (m, j)
+    result = hashlife_results.get(key)
+    if result is not None:
+        return result
+
+    if m.n == 0:
+        result = m.a
+    elif m.k == 2:
+        result = life_4x4(m)
+    else:
+        j = min(j, m.k - 2)
+        c1 = successor(join(m.a.a, m.a.b, m.a.c, m.a.d), j)
+        c2 = successor(join(m.a.b, m.b.a, m.a.d, m.b.c), j)
+        c3 = successor(join(m.b.a, m.b.b, m.b.c, m.b.d), j)
+        c4 = successor(join(m.a.c, m.a.d, m.c.a, m.c.b), j)
+        c5 = successor(join(m.a.d, m.b.c, m.c.b, m.d.a), j)
+        c6 = successor(join(m.b.c, m.b.d, m.d.a, m.d.b), j)
+        c7 = successor(join(m.c.a, m.c.b, m.c.c, m.c.d), j)
+        c8 = successor(join(m.c.b, m.d.a, m.c.d, m.d.c), j)
+        c9 = successor(join(m.d.a, m.d.b, m.d.c, m.d.d), j)
+
+        if j < m.k - 2:
+            # Шаг меньше максимального: достаточно собрать центр из уже вычисленных частей
+            result = join(
+                join(c1.d, c2.c, c4.b, c5.a),
+                join(c2.d, c3.c, c5.b, c6.a),
+                join(c4.d, c5.c, c7.b, c8.a),
+                join(c5.d, c6.c, c8.b, c9.a)
+            )
+        else:
+            # Максимальный шаг: ещё 2^(k-3) поколений для каждой из четырёх частей
+            result = join(
+                successor(join(c1, c2, c4, c5), j),
+                successor(join(c2, c3, c5, c6), j),
+                successor(join(c4, c5, c7, c8), j),
+                successor(join(c5, c6, c8, c9), j)
+            )
+
+    if len(hashlife_results) >= hashlife_cache_size:
+        hashlife_results.clear()
+    hashlife_results[key] = result
+    return result
+
+# Построение узла уровня k для клеток cells (координаты относительно левого верхнего угла узла)
+def build_node(cells, k):
+    if not cells:
+        return empty(k)
+    if k == 0:
+        return hashlife_on
+    half = 1 << (k - 1)
+    parts = ([], [], [], [])
+    for (y, x) in cells:
+        parts[(y >= half) * 2 + (x >= half)].append((y % half, x % half))
+    return join(
+        build_node(parts[0], k - 1),
+        build_node(parts[1], k - 1),
+        build_node(parts[2], k - 1),
+        build_node(parts[3], k - 1)
+    )
+
+# Сбор живых клеток узла с левым верхним углом (y0, x0), попадающих в окно h x w
+def node_cells(m, y0, x0, h, w, cells):
+    size = 1 << m.k
+    if m.n == 0 or y0 >= h or x0 >= w or y0 + size <= 0 or x0 + size <= 0:
+        return
+    if m.k == 0:
+        cells[(y0, x0)] = max_age_color
+        return
+    half = size >> 1
+    node_cells(m.a, y0, x0, h, w, cells)
+    node_cells(m.b, y0, x0 + half, h, w, cells)
+    node_cells(m.c, y0 + half, x0, h, w, cells)
+    node_cells(m.d, y0 + half, x0 + half, h, w, cells)
+
+# Проверка, что все живые клетки узла находятся в его центральной части
+def is_padded(m):
+    return m.a.n == m.a.d.n and m.b.n == m.b.c.n and m.c.n == m.c.b.n and m.d.n == m.d.a.n
+
+# Продвижение узла с левым верхним углом (y0, x0) на generations поколений
+def advance(m, y0, x0, generations):
+    j = 0
+    while generations > 0:
+        if generations & 1:
+            while m.k < j + 2 or not is_padded(m):
+                half = 1 << (m.k - 1)
+                m = centre(m)
+                y0 -= half
+                x0 -= half
+            m = successor(centre(m), j)
+        generations >>= 1
+        j += 1
+    return m, y0, x0
+
+# Моделирование методом Hashlife: сохраняются только поколения из списка snapshots.
+# Возвращает количество живых клеток в области поля в последнем сохранённом поколении
+def run_hashlife(field, steps, writer, snapshots, profiler):
+    h = len(field)
+    w = len(field[0])
 
+    cells = []
     for y in range(h):
         for x in range(w):
             if field[y][x] > 0:
-                color = age_to_color(ages[y][x], base_color)
-            else:
-                color = (255, 255, 255)
-            for dy in range(cell_size):
-                for dx in range(cell_size):
-                    px = x * cell_size + dx
-                    py = y * cell_size + dy
-                    pixels[px, py] = color
-    img.save(filename)
+                cells.append((y, x))
+    k = 2
+    while (1 << k) < max(h, w):
+        k += 1
+    m = build_node(cells, k)
+    y0 = 0
+    x0 = 0
 
-# Основная функция программы
-def main():
-    if len(sys.argv) < 4:
-        print("Ошибка: недостаточно параметров")
-        return
+    generation = 0
+    for target in sorted(set(snapshots)):
+        if target < 0 or target > steps:
+            continue
+        with profiler.measure(target, "step"):
+            m, y0, x0 = advance(m, y0, x0, target - generation)
+        generation = target
+
+        with profiler.measure(generation, "snapshot"):
+            live = {}
+            node_cells(m, y0, x0, h, w, live)
+            snapshot_field, snapshot_ages = from_cells(live, h, w)
+        writer.write(snapshot_field, snapshot_ages, generation)
+    return len(live)
+
+# Количество живых клеток поля
+def count_live(field):
+    if np is not None and isinstance(field, np.ndarray):
+        return int(np.count_nonzero(field))
+    return sum(1 for row in field for c in row if c > 0)
+
+# Отпечаток поколения: хеш упакованного поля (возраст клеток не учитывается)
+def field_fingerprint(field, h, w):
+    return hashlib.blake2b(pack_field(field, h, w), digest_size=16).digest()
+
+# Максимальное количество последних поколений, отпечатки которых хранятся для поиска циклов
+cycle_history_size = 1000
+
+# Поиск повторяющихся поколений: хранит отпечатки последних cycle_history_size поколений
+class CycleDetector:
+    def __init__(self):
+        self.seen = {}
+        self.order = deque()
+
+    # Добавление поколения; возвращает номер более раннего поколения с тем же полем или None
+    def add(self, field, h, w, generation):
+        key = field_fingerprint(field, h, w)
+        if key in self.seen:
+            return self.seen[key]
+        self.seen[key] = generation
+        self.order.append(key)
+        if len(self.order) > cycle_history_size:
+            del self.seen[self.order.popleft()]
+        return None
+
+# Описание найденного цикла: поле поколения start повторяется каждые period поколений
+def cycle_message(field, start, period):
+    if count_live(field) == 0:
+        return f"Колония вымерла на поколении {start}"
+    if period == 1:
+        return f"Устойчивая конфигурация (still life) начиная с поколения {start}"
+    return f"Период {period} начиная с поколения {start}"
+
+# Клетки, живые во всех кадрах цикла
+def always_alive(fields):
+    if np is not None and isinstance(fields[0], np.ndarray):
+        return np.logical_and.reduce(fields).astype(np.uint8)
+    result = [row[:] for row in fields[0]]
+    for field in fields[1:]:
+        for y in range(len(result)):
+            for x in range(len(result[y])):
+                result[y][x] = 1 if result[y][x] > 0 and field[y][x] > 0 else 0
+    return result
+
+# Возраст клеток через delta поколений для клеток, живых во всех кадрах цикла
+def shift_ages(ages, alive, delta):
+    if np is not None and isinstance(ages, np.ndarray):
+        return saturate_ages(ages, np.asarray(alive, dtype=np.uint8), delta)
+    return [[age + delta * c for age, c in zip(row_ages, row_alive)] for row_ages, row_alive in zip(ages, alive)]
 
-    input_file = sys.argv[1]
-    steps = int(sys.argv[2])
-    output_dir = sys.argv[3]
-    color_name = sys.argv[4] if len(sys.argv) > 4 else "green"
+# Сохранение оставшихся поколений без моделирования: frames - поля и возрасты поколений
+# first .. first + period - 1 одного периода цикла, далее поколения повторяются
+def fill_cycle(frames, first, steps, snapshots, writer):
+    period = len(frames)
+    alive = always_alive([field for field, ages in frames])
+    for i in range(first + period, steps + 1):
+        if snapshots is not None and i not in snapshots:
+            continue
+        cycles, j = divmod(i - first, period)
+        field, ages = frames[j]
+        writer.write(field, shift_ages(ages, alive, cycles * period), i)
+
+# Разбор параметров командной строки: позиционные параметры и ключи вида --имя=значение
+def parse_args(argv):
+    args = []
+    options = {}
+    for arg in argv:
+        if arg.startswith("--"):
+            name, _, value = arg[2:].partition("=")
+            options[name] = value
+        else:
+            args.append(arg)
+    return args, options
 
+# Моделирование: чтение поля, заданное количество шагов и сохранение результатов.
+# Возвращает словарь со статистикой запуска или None при ошибке
+def run(input_file, steps, output_dir, color_name="green", engine="list", snapshots=None, writers=2,
+        output="files", animation=None, cycles=None, profile=None):
     if color_name not in base_colors:
         print("Ошибка: указан недопустимый цвет")
         return
     base_color = base_colors[color_name]
+    profiler = PhaseProfiler(profile)
+    if profile is not None:
+        # Пик памяти в профиле относится к одному поколению, только если файлы сохраняются без фоновых потоков
+        writers = 0
+
+    if engine == "hashlife":
+        if cycles is not None:
+            print("Ошибка: поиск циклов не поддерживается движком hashlife")
+            return
+        if snapshots is None:
+            snapshots = [0, steps]
+        if not any(0 <= target <= steps for target in snapshots):
+            print(f"Ошибка: ни одно поколение из списка snapshots не входит в диапазон от 0 до {steps}")
+            return
+        os.makedirs(output_dir, exist_ok=True)
+        try:
+            with profiler.measure(0, "read"):
+                field = read_field(input_file)
+        except ValueError as e:
+            print(f"Ошибка: {e}")
+            profiler.close()
+            return
+        writer = SnapshotWriter(output_dir, base_color, len(field), len(field[0]), writers, output, animation, profiler)
+        try:
+            final_live = run_hashlife(field, steps, writer, snapshots, profiler)
+        finally:
+            writer.close()
+            profiler.close()
+        return {"generations": steps, "initial_live": count_live(field), "final_live": final_live, "cycle": ""}
+
+    if engine not in engines:
+        print("Ошибка: указан недопустимый движок")
+        return
+    if engine in ("numpy", "parallel", "tiles") and np is None:
+        print(f"Ошибка: для движка {engine} необходимо установить библиотеку numpy")
+        return
+    prepare, step_engine, snapshot, finish = engines[engine]
 
     os.makedirs(output_dir, exist_ok=True)
 
-    field = read_field(input_file)
+    try:
+        with profiler.measure(0, "read"):
+            if engine in ("list", "sparse"):
+                field = read_field(input_file)
+            else:
+                field = read_field_array(input_file)
+    except ValueError as e:
+        print(f"Ошибка: {e}")
+        profiler.close()
+        return
     h = len(field)
     w = len(field[0])
 
-    ages = []
-    for y in range(h):
-        row = []
-        for x in range(w):
-            if field[y][x] > 0:
-                row.append(1)
-            else:
-                row.append(0)
-        ages.append(row)
+    if np is not None and isinstance(field, np.ndarray):
+        ages = field.copy()
+    else:
+        ages = []
+        for y in range(h):
+            row = []
+            for x in range(w):
+                if field[y][x] > 0:
+                    row.append(1)
+                else:
+                    row.append(0)
+            ages.append(row)
+
+    state = prepare(field, ages)
+    writer = SnapshotWriter(output_dir, base_color, h, w, writers, output, animation, profiler)
+
+    detector = CycleDetector() if cycles is not None else None
+    period = None
+    frames = []
+    stats = {"generations": steps, "initial_live": count_live(field), "final_live": 0, "cycle": ""}
+    final_field = None
+
+    try:
+        if snapshots is None or 0 in snapshots:
+            writer.write(field, ages, 0)
+        if detector is not None:
+            detector.add(field, h, w, 0)
+
+        for i in range(1, steps + 1):
+            with profiler.measure(i, "step"):
+                state = step_engine(state, h, w)
+            need_snapshot = snapshots is None or i in snapshots
+            if detector is None and not need_snapshot:
+                continue
+            with profiler.measure(i, "snapshot"):
+                field, ages = snapshot(state, h, w)
+            if need_snapshot:
+                writer.write(field, ages, i)
+            if detector is None:
+                continue
+
+            if period is None:
+                start = detector.add(field, h, w, i)
+                if start is None:
+                    continue
+                period = i - start
+                stats["cycle"] = cycle_message(field, start, period)
+                print(stats["cycle"])
+                if cycles == "stop":
+                    stats["generations"] = i
+                    final_field = field
+                    break
+            elif cycles == "fill":
+                # Поколения следующего периода сохраняются, после чего остальные поколения повторяют их
+                frames.append((field, ages))
+                if len(frames) == period:
+                    fill_cycle(frames, i - period + 1, steps, snapshots, writer)
+                    final_field = frames[(steps - i + period - 1) % period][0]
+                    break
+
+        if final_field is None:
+            final_field, _ = snapshot(state, h, w)
+        stats["final_live"] = count_live(final_field)
+    finally:
+        finish(state)
+        writer.close()
+        profiler.close()
+    return stats
+
+# Запуск одного задания пакетного режима в процессе пула: job - словарь с полями input, steps,
+# output_dir, color, options - параметры моделирования; возвращает строку итоговой таблицы
+def run_job(job, options):
+    start = time.perf_counter()
+    status = "ok"
+    stats = None
+    if options.get("profile") is not None:
+        # У каждого задания свой файл профиля в его каталоге результатов, иначе задания перезаписывали бы один файл
+        options = dict(options, profile=os.path.join(job["output_dir"], os.path.basename(options["profile"])))
+    try:
+        stats = run(job["input"], int(job["steps"]), job["output_dir"], job.get("color") or "green", **options)
+        if stats is None:
+            status = "error"
+    except Exception as e:
+        status = f"error: {e}"
+    row = {
+        "input": job["input"],
+        "steps": job["steps"],
+        "output_dir": job["output_dir"],
+        "color": job.get("color") or "green",
+        "status": status,
+        "seconds": f"{time.perf_counter() - start:.3f}"
+    }
+    row.update(stats or {"generations": "", "initial_live": "", "final_live": "", "cycle": ""})
+    return row
+
+# Столбцы итоговой таблицы пакетного режима
+batch_columns = ["input", "steps", "output_dir", "color", "status", "seconds", "generations", "initial_live", "final_live", "cycle"]
+
+# Пакетный режим: задания читаются из csv-файла manifest (столбцы input, steps, output_dir, color) и выполняются
+# в пуле из jobs процессов, которые импортируют программу и библиотеки один раз. options - ключи командной строки
+# для настройки процессов, run_options - параметры моделирования, общие для всех заданий. Время выполнения
+# и количество живых клеток каждого задания записываются в csv-файл summary
+def run_batch(manifest, summary, jobs, options, run_options):
+    with open(manifest, newline="", encoding="utf-8") as f:
+        tasks = list(csv.DictReader(f))
+
+    with open(summary, "w", newline="", encoding="utf-8") as f:
+        table = csv.DictWriter(f, fieldnames=batch_columns)
+        table.writeheader()
+        with ProcessPoolExecutor(max_workers=jobs, initializer=configure, initargs=(options,)) as pool:
+            futures = [pool.submit(run_job, task, run_options) for task in tasks]
+            for future in as_completed(futures):
+                row = future.result()
+                table.writerow(row)
+                f.flush()
+                print(f"{row['input']} -> {row['output_dir']}: {row['status']}, {row['seconds']} с")
+
+# Настройка параметров модуля из ключей командной строки (вызывается и в процессах пакетного режима)
+def configure(options):
+    global hashlife_cache_size, parallel_workers
+    if "cache" in options:
+        hashlife_cache_size = int(options["cache"])
+    if "workers" in options:
+        parallel_workers = int(options["workers"])
+
+# Основная функция программы
+def main():
+    args, options = parse_args(sys.argv[1:])
+    if "convert" in options:
+        if len(args) < 1:
+            print("Ошибка: недостаточно параметров")
+            return
+        if np is None:
+            print("Ошибка: для преобразования поля необходимо установить библиотеку numpy")
+            return
+        try:
+            convert_seed(args[0], options["convert"])
+        except ValueError as e:
+            print(f"Ошибка: {e}")
+        return
+
+    engine = options.get("engine", "list")
+    snapshots = None
+    if "snapshots" in options:
+        snapshots = set(int(value) for value in options["snapshots"].split(","))
+
+    writers = int(options.get("writers", 2))
+    cycles = options.get("cycles")
+    if cycles not in (None, "report", "stop", "fill"):
+        print("Ошибка: указан недопустимый режим поиска циклов")
+        return
+    output = options.get("output", "files")
+    animation = options.get("animation")
+    if output not in ("files", "history"):
+        print("Ошибка: указан недопустимый формат результатов")
+        return
+    if animation not in (None, "gif"):
+        print("Ошибка: указан недопустимый формат анимации")
+        return
+
+    configure(options)
+    run_options = {
+        "engine": engine,
+        "snapshots": snapshots,
+        "writers": writers,
+        "output": output,
+        "animation": animation,
+        "cycles": cycles,
+        "profile": options.get("profile")
+    }
+
+    if "batch" in options:
+        jobs = int(options.get("jobs", os.cpu_count() or 1))
+        summary = options.get("summary", "summary.csv")
+        run_batch(options["batch"], summary, jobs, options, run_options)
+        return
+
+    if len(args) < 3:
+        print("Ошибка: недостаточно параметров")
+        return
 
-    write_field(field, os.path.join(output_dir, "step_0.txt"))
-    save_image(field, ages, os.path.join(output_dir, "step_0.png"), base_color, h, w)
+    input_file = args[0]
+    steps = int(args[1])
+    output_dir = args[2]
+    color_name = args[3] if len(args) > 3 else "green"
 
-    for i in range(1, steps + 1):
-        field, ages = step(field, ages, h, w)
-        write_field(field, os.path.join(output_dir, f"step_{i}.txt"))
-        save_image(field, ages, os.path.join(output_dir, f"step_{i}.png"), base_color, h, w)
+    run(input_file, steps, output_dir, color_name, **run_options)
 
-main()
-        
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Измерение производительности программы "Жизнь" (life.py)
+
+Программа строит поля нескольких размеров и плотностей, а также поля, содержащие только планеры (как во входном файле input.txt), и для каждого
+движка моделирования измеряет:
+- количество поколений в секунду;
+- количество обработанных клеток в секунду (площадь поля, умноженная на количество поколений в секунду);
+- скорость построения изображений (клеток в секунду) и записи текстовых файлов (клеток в секунду).
+
+Каждый движок выполняет шаги, пока не истечёт заданное время (но не меньше одного шага). Движки list и sparse работают на чистом Python, поэтому для них
+пропускаются поля, где количество клеток (для sparse - живых клеток) больше ограничения. Изображения строятся только для полей, размер изображения которых
+не больше ограничения. Движок hashlife не участвует в измерениях, так как он не вычисляет поколения по одному.
+
+Запуск программы: python life_bench.py [ключи]
+Ключи указываются в виде --имя=значение:
+--sizes - размеры сторон полей через запятую (по умолчанию 64,256,1024,4096);
+--densities - доли живых клеток для случайных полей через запятую (по умолчанию 0.1,0.3); поля с планерами измеряются всегда;
+--engines - движки через запятую (по умолчанию list,numpy,sparse,tiles,parallel);
+--seconds - время измерения одного движка на одном поле в секундах (по умолчанию 1);
+--python-max-cells - ограничение для движков list и sparse (по умолчанию 262144);
+--render-max-pixels - ограничение размера изображения в пикселях (по умолчанию 67108864);
+--csv - имя csv-файла для сохранения результатов (по умолчанию результаты только выводятся на экран).
+
+Пример запуска: python life_bench.py --sizes=64,256 --engines=numpy,tiles --seconds=2 --csv=bench.csv
+
+Для работы программы необходимы библиотеки pillow и numpy.
+"""
+
+import os
+import sys
+import csv
+import time
+import tempfile
+
+import numpy as np
+
+import life
+
+# Планер из входного файла input.txt
+glider = [(0, 1), (1, 2), (2, 0), (2, 1), (2, 2)]
+
+# Расстояние между планерами на поле с планерами (в клетках)
+glider_spacing = 16
+
+# Случайное поле size x size (массив NumPy), где каждая клетка живая с вероятностью density
+def random_field(size, density, seed=1):
+    rng = np.random.default_rng(seed)
+    return (rng.random((size, size)) < density).astype(np.uint8)
+
+# Поле size x size (массив NumPy) с планерами, расставленными через glider_spacing клеток
+def glider_field(size):
+    field = np.zeros((size, size), dtype=np.uint8)
+    for dy, dx in glider:
+        field[1 + dy:size - 3 + dy:glider_spacing, 1 + dx:size - 3 + dx:glider_spacing] = 1
+    return field
+
+# Поля для измерений: (название, поле). Поля строятся по одному при переборе, чтобы в памяти было только текущее поле
+def boards(sizes, densities):
+    for size in sizes:
+        for density in densities:
+            yield f"random {size}x{size} p={density}", random_field(size, density)
+        yield f"gliders {size}x{size}", glider_field(size)
+
+# Измерение одного движка на одном поле: возвращает словарь с результатами или None, если поле пропущено
+def measure(engine, field, seconds, python_max_cells, render_max_pixels, tmpdir):
+    h = len(field)
+    w = len(field[0])
+    live = life.count_live(field)
+    if engine == "list" and h * w > python_max_cells:
+        return None
+    if engine == "sparse" and live > python_max_cells:
+        return None
+
+    prepare, step_engine, snapshot, finish = life.engines[engine]
+    # Движки на чистом Python получают поле в виде списков, остальные - массив NumPy
+    if engine in ("list", "sparse"):
+        field = field.tolist()
+        ages = [row[:] for row in field]
+    else:
+        ages = field.copy()
+    state = prepare(field, ages)
+    try:
+        generations = 0
+        start = time.perf_counter()
+        while True:
+            state = step_engine(state, h, w)
+            generations += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= seconds:
+                break
+        result_field, result_ages = snapshot(state, h, w)
+    finally:
+        finish(state)
+
+    result = {
+        "generations_per_second": generations / elapsed,
+        "cells_per_second": generations * h * w / elapsed,
+        "render_cells_per_second": None,
+        "write_cells_per_second": None
+    }
+
+    start = time.perf_counter()
+    life.write_field(result_field, os.path.join(tmpdir, "bench.txt"))
+    result["write_cells_per_second"] = h * w / (time.perf_counter() - start)
+
+    if h * w * life.cell_size ** 2 <= render_max_pixels:
+        start = time.perf_counter()
+        life.save_image(result_field, result_ages, os.path.join(tmpdir, "bench.png"), life.base_colors["green"], h, w)
+        result["render_cells_per_second"] = h * w / (time.perf_counter() - start)
+    return result
+
+# Форматирование числа для таблицы
+def format_rate(value):
+    if value is None:
+        return "-"
+    return f"{value:.3g}"
+
+# Основная функция программы
+def main():
+    args, options = life.parse_args(sys.argv[1:])
+    sizes = [int(value) for value in options.get("sizes", "64,256,1024,4096").split(",")]
+    densities = [float(value) for value in options.get("densities", "0.1,0.3").split(",")]
+    engine_names = options.get("engines", "list,numpy,sparse,tiles,parallel").split(",")
+    seconds = float(options.get("seconds", 1))
+    python_max_cells = int(options.get("python-max-cells", 512 * 512))
+    render_max_pixels = int(options.get("render-max-pixels", 8192 * 8192))
+
+    for engine in engine_names:
+        if engine not in life.engines:
+            print(f"Ошибка: недопустимый движок {engine}")
+            return
+
+    columns = ["board", "engine", "generations_per_second", "cells_per_second", "render_cells_per_second", "write_cells_per_second"]
+    rows = []
+    print(f"{'поле':<28} {'движок':<10} {'покол./с':>10} {'клеток/с':>10} {'изобр./с':>10} {'текст/с':>10}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, field in boards(sizes, densities):
+            for engine in engine_names:
+                result = measure(engine, field, seconds, python_max_cells, render_max_pixels, tmpdir)
+                if result is None:
+                    print(f"{name:<28} {engine:<10} пропущено")
+                    continue
+                print(
+                    f"{name:<28} {engine:<10} "
+                    f"{format_rate(result['generations_per_second']):>10} "
+                    f"{format_rate(result['cells_per_second']):>10} "
+                    f"{format_rate(result['render_cells_per_second']):>10} "
+                    f"{format_rate(result['write_cells_per_second']):>10}"
+                )
+                result.update({"board": name, "engine": engine})
+                rows.append(result)
+
+    if "csv" in options:
+        with open(options["csv"], "w", newline="", encoding="utf-8") as f:
+            table = csv.DictWriter(f, fieldnames=columns)
+            table.writeheader()
+            for row in rows:
+                table.writerow({key: "" if row[key] is None else row[key] for key in columns})
+
+if __name__ == "__main__":
+    main()
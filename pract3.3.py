@@ -34,7 +34,18 @@
      validate_input: D => {True, False}
      convert_units: (d₁, h, Vₛ) => (d₁', h', Vₛ')
      find_optimal_angle: (d₁', d₂, h', Vₛ', n) => (θ_opt, t_min)
-     display_results: (θ_opt, t_min) => output(θ_opt, t_min)
+     (перебор целых углов от 0 до 90 градусов, эталон для тестов)
+     solve_optimal_angle: (d₁', d₂, h', Vₛ', n) => (θ_opt, t_min, k)
+     (метод Ньютона, k - количество итераций)
+     display_results: (θ_opt, t_min, k) => output(θ_opt, t_min, k)
+
+   3.4 Условие минимума (закон преломления Снеллиуса):
+        sin θ₁ / sin θ₂ = n, где sin θ₁ = x / L₁, sin θ₂ = (h' - x) / L₂
+        Функция g(x) = x / L₁ - n × (h' - x) / L₂ возрастает на [0, h'],
+        g(0) < 0, g(h') > 0, поэтому корень единственный; он находится
+        методом Ньютона, g'(x) = d₁'² / L₁³ + n × d₂² / L₂³. Шаг, выходящий
+        за текущий отрезок [a, b], содержащий корень, заменяется делением
+        отрезка пополам. Оптимальный угол θ_opt = arctg(x / d₁').
 
 5. Предусловия:
    C1: d₁ > 0 ∧ d₂ > 0 ∧ h > 0
@@ -44,8 +55,9 @@
 
 6. Постусловие:
    После выполнения программы будет выведено минимальное время t_min ∈ R+
-   с точностью до 0.1 секунды и соответствующий угол θ_opt ∈ [0, 90],
-   при котором достигается минимальное время.
+   с точностью до 0.1 секунды и соответствующий угол θ_opt ∈ [0, 90]
+   (дробный, с точностью до 0.0001 градуса), при котором достигается
+   минимальное время, и количество итераций метода Ньютона.
 """
 
 import math
@@ -106,10 +118,48 @@ def find_optimal_angle(d1_f, d2, h_f, V_sand_fs, n):
     
     return optimal_angle, min_time
 
-def display_results(theta_opt, t_min):
+# Максимальное количество итераций и относительная точность метода Ньютона
+newton_max_iterations = 100
+newton_tolerance = 1e-12
+
+def solve_optimal_angle(d1_f, d2, h_f, V_sand_fs, n):
+    # Функция для поиска оптимального угла методом Ньютона по условию преломления
+    # (возвращает угол, время и количество итераций)
+    a, b = 0.0, h_f
+    x = h_f * d1_f / (d1_f + d2)  # точка пересечения прямой AC с кромкой воды (решение при n = 1)
+    iterations = 0
+    
+    while iterations < newton_max_iterations:
+        iterations += 1
+        L1 = math.sqrt(x**2 + d1_f**2)
+        L2 = math.sqrt((h_f - x)**2 + d2**2)
+        g = x / L1 - n * (h_f - x) / L2
+        if g == 0:
+            break
+        if g < 0:
+            a = x
+        else:
+            b = x
+        
+        dg = d1_f**2 / L1**3 + n * d2**2 / L2**3
+        x_new = x - g / dg
+        if abs(x_new - x) <= newton_tolerance * h_f:
+            x = x_new
+            break
+        if not a < x_new < b:
+            x_new = (a + b) / 2
+        x = x_new
+    
+    theta_opt = math.degrees(math.atan2(x, d1_f))
+    t_min = calculate_time_for_angle(d1_f, d2, h_f, V_sand_fs, n, theta_opt)
+    return theta_opt, t_min, iterations
+
+def display_results(theta_opt, t_min, iterations=None):
     # Функция для вывода результатов
-    print(f"\nОптимальный угол для начала движения: {theta_opt} градусов")
+    print(f"\nОптимальный угол для начала движения: {theta_opt:.4f} градусов")
     print(f"Минимальное время достижения утопающего: {t_min:.1f} секунд")
+    if iterations is not None:
+        print(f"Количество итераций метода Ньютона: {iterations}")
 
 def test_convert_units():
     print("\nТестирование convert_units")
@@ -192,6 +242,29 @@ def test_find_optimal_angle():
     
     print(f"Найден оптимальный угол: {theta_opt}°, время: {t_min:.2f} сек")
 
+def test_solve_optimal_angle():
+    print("\nТестирование solve_optimal_angle")
+    
+    print("Тест 1: Совпадение с перебором углов")
+    for d1_f, d2, h_f, V_sand_fs, n in [(30, 50, 60, 7.3333, 1.5), (150, 30, 300, 14.6667, 3), (3, 200, 30, 5, 10)]:
+        theta_grid, t_grid = find_optimal_angle(d1_f, d2, h_f, V_sand_fs, n)
+        theta_opt, t_min, iterations = solve_optimal_angle(d1_f, d2, h_f, V_sand_fs, n)
+        assert abs(theta_opt - theta_grid) <= 1, f"θ={theta_opt}, по перебору {theta_grid}"
+        assert t_min <= t_grid + 1e-9, f"t_min={t_min} должно быть ≤ {t_grid}"
+        print(f"θ={theta_opt:.6f}° (перебор {theta_grid}°), t={t_min:.4f} сек (перебор {t_grid:.4f}), итераций: {iterations}")
+    print("Тест 1 пройден")
+    
+    print("Тест 2: Закон преломления")
+    d1_f, d2, h_f, V_sand_fs, n = 30, 50, 60, 7.3333, 1.5
+    theta_opt, t_min, iterations = solve_optimal_angle(d1_f, d2, h_f, V_sand_fs, n)
+    x = d1_f * math.tan(math.radians(theta_opt))
+    sin_1 = x / math.sqrt(x**2 + d1_f**2)
+    sin_2 = (h_f - x) / math.sqrt((h_f - x)**2 + d2**2)
+    assert abs(sin_1 / sin_2 - n) < 1e-9, f"sin θ₁ / sin θ₂ = {sin_1 / sin_2}, ожидалось {n}"
+    assert iterations <= 10, f"Слишком много итераций: {iterations}"
+    print(f"sin θ₁ / sin θ₂ = {sin_1 / sin_2:.12f}, итераций: {iterations}")
+    print("Тест 2 пройден")
+
 
 print("\n ПРОГРАММА ДЛЯ ОПРЕДЕЛЕНИЯ ОПТИМАЛЬНОГО УГЛА ДВИЖЕНИЯ СПАСАТЕЛЯ")
 
@@ -204,12 +277,13 @@ if not is_valid:
 else:
     d1_f, h_f, V_sand_fs = convert_units(d1, h, V_sand)
     
-    theta_opt, t_min = find_optimal_angle(d1_f, d2, h_f, V_sand_fs, n)
+    theta_opt, t_min, iterations = solve_optimal_angle(d1_f, d2, h_f, V_sand_fs, n)
     
-    display_results(theta_opt, t_min)
+    display_results(theta_opt, t_min, iterations)
 
 # Запуск тестов
 test_convert_units()
 test_calculate_time()
 test_validate_input()
 test_find_optimal_angle()
+test_solve_optimal_angle()
@@ -9,7 +9,7 @@
 
 Запуск программы: осуществляется из командной строки (команда python pract6.py). После запуска выводится предложение ввода команды.
 
-После запуска пользователь видит предложение ввести какую-либо из следующих команд: loc, zip, dist, end (команды не чувствительны к регистру символов).
+После запуска пользователь видит предложение ввести какую-либо из следующих команд: loc, zip, city, dist, near, radius, reverse, state, county, area, stats, reload, end (команды не чувствительны к регистру символов).
 
 Команда loc: ищет информацию по почтовому индексу. После ввода команды программа запрашивает почтовый индекс. Результат работы команды: город, штат, географические координаты (формат: градусы/минуты/секунды и
 направление)
@@ -17,11 +17,87 @@
 Команда zip: ищет все почтовые индексы по названию города и штата. После ввода команды программа запрашивает названия города и штата. Результат - список всех найденных почтовых индексов, отсортированных по
 возрастанию.
 
+Если город и штат не найдены, выводятся похожие названия (с учётом опечаток).
+
+Команда city: ищет города по названию, его началу или названию с опечатками. Программа запрашивает название города и штат (можно оставить пустым,
+тогда поиск выполняется по всем штатам). Результат - до 10 подсказок "город, штат (количество почтовых индексов)": сначала точные совпадения, затем
+названия, начинающиеся с введённого, затем названия с опечатками. Для поиска строится индекс названий (отсортированный список названий для поиска
+по началу названия и триграммы для поиска с опечатками).
+
 Команда dist: вычисляет расстояние между двумя географическими точками, заданными их почтовыми индексами. После ввода команды программа запрашивает 2 почтовых индекса. Результат - расстояние, вычисленное по
 формуле гаверсинусов (в милях).
 
+При первом запуске рядом с csv-файлом создаётся файл кэша zip_codes_states.cache. При следующих запусках данные читаются из кэша, который отображается в память,
+и csv-файл не разбирается заново. Кэш перестраивается автоматически, если csv-файл изменился (сравниваются время изменения, размер и хеш файла).
+
+Данные хранятся в виде столбцов (класс ZipColumns): координаты - в массивах array('d'), почтовые индексы - в виде чисел, названия городов, штатов и округов -
+номерами в общей таблице строк, где каждое название хранится один раз. Поиск выполняется по номерам записей. Почтовые индексы могут состоять из 5 цифр
+или быть индексами ZIP+4 (12345-6789 или 123456789, выводятся в виде 12345-6789); записи с другими индексами пропускаются.
+
+Команда near: ищет ближайшие почтовые индексы. Программа запрашивает почтовый индекс и количество k. Результат - k ближайших почтовых индексов (без
+введённого) и расстояния до них в милях, по возрастанию расстояния. Отрицательное количество - ошибка.
+
+Команда radius: ищет все почтовые индексы в заданном радиусе. Программа запрашивает почтовый индекс и радиус в милях. Результат - все почтовые индексы
+(без введённого) не дальше заданного расстояния, по возрастанию расстояния. Радиус должен быть конечным неотрицательным числом.
+
+Команда reverse: ищет ближайший почтовый индекс к точке. Программа запрашивает широту и долготу (в десятичных градусах, например 40.92 и -72.64,
+или в том же формате, в котором их выводит команда loc, например 040°55'20.37"N и 072°38'13.48"W). Результат - ближайший почтовый индекс, город,
+штат, округ и расстояние до точки в милях.
+
+Для команд near, radius и reverse используется пространственный индекс: записи разложены по ячейкам сетки 1 x 1 градус, и расстояния вычисляются только до записей
+из ближайших ячеек. Если установлена библиотека numpy, расстояния вычисляются сразу для всех таких записей.
+
+Пакетный режим: для вычисления большого количества расстояний программа запускается с аргументами командной строки ("-" вместо имени файла
+используется стандартный ввод или вывод, по умолчанию результат выводится в стандартный вывод):
+python pract6.py pairs <pairs.csv> [<output.csv>] - расстояния для пар почтовых индексов из csv-файла (в каждой строке два индекса); результат - csv-файл
+со столбцами zip_code1, zip_code2, miles (если индекса нет в данных, расстояние не заполняется);
+python pract6.py matrix <from.csv> <to.csv> [<output.csv>] - матрица расстояний между двумя списками почтовых индексов (по одному индексу в строке);
+результат - csv-файл, первая строка которого содержит индексы второго списка, а каждая следующая - индекс первого списка и расстояния до всех индексов
+второго списка. Ненайденные индексы выводятся в стандартный поток ошибок;
+python pract6.py reverse <points.csv> [<output.csv>] - ближайшие почтовые индексы для точек из csv-файла (в каждой строке широта и долгота, как
+в команде reverse); результат - csv-файл со столбцами latitude, longitude, zip_code, city, state, county, miles (для неверных координат поля
+почтового индекса не заполняются).
+Строка заголовка во входных файлах необязательна. Расстояния вычисляются частями (NumPy - сразу для всей части), поэтому размер входных данных
+не ограничен объёмом памяти.
+
+Режим сервера (для запросов из других программ без запуска процесса на каждый запрос): python pract6.py serve - запросы читаются из стандартного
+ввода, python pract6.py serve <порт> - TCP-сервер на 127.0.0.1, python pract6.py serve <путь> - сервер на Unix-сокете (клиенты обслуживаются
+одновременно). Каждый запрос - одна строка в формате JSON, например {"cmd": "dist", "zip1": "00501", "zip2": "35004", "id": 1}; команды loc (поле zip),
+zip (поля city, state), city (поля name, state - необязательно, limit - необязательно), dist (поля zip1, zip2), near (поля zip, count), radius (поля zip, miles), reverse (поля lat, lon), state (поле state), county (поля state, county -
+необязательно), area (поля city, state), stats (статистика запросов к серверу), reload (перезагрузка csv-файла). Запросы можно отправлять, не дожидаясь ответов;
+ответ на каждый запрос - одна строка в формате JSON (поле id запроса копируется в ответ, при ошибке ответ содержит поле error). Ответы отправляются
+в порядке запросов. Сервер на порту или сокете раз в минуту проверяет, изменился ли csv-файл, и перезагружает его в отдельном потоке, продолжая
+отвечать на запросы.
+
+Использование из других программ: при импорте модуля (import pract6) данные не загружаются и REPL не запускается. Класс ZipDatabase загружает данные
+при первом запросе; функция shared_database() возвращает один общий объект ZipDatabase на процесс. Методы ZipDatabase можно вызывать одновременно из
+нескольких потоков: location(zip_code), zip_codes(city, state), distance(zip1, zip2), nearest(zip_code, count), within(zip_code, miles),
+reverse(lat, lon), suggest_cities(name, state=None, limit=10), state_summary(state), county_summary(state, county=None),
+city_summary(city, state) и query(request) (запрос в формате режима сервера). Например:
+pract6.shared_database().distance("00501", "35004").
+
 Если введённые по запросу данные отсутствуют в csv-файле, выводится сообщение об ошибке. (строки файла с некорректными или отсутствующими координатами автоматически пропускаются при чтении данных)
 
+Команды state, county и area выводят сводки: количество почтовых индексов, центр (среднее положение точек на сфере) и границы (наименьшие и
+наибольшие широта и долгота). Команда state запрашивает штат и выводит также количество округов штата. Команда county запрашивает штат и округ; если
+округ не указан, выводится количество почтовых индексов в каждом округе штата. Команда area запрашивает город и штат. Сводки по штатам и округам
+вычисляются один раз за один проход по данным, после чего ответ - поиск в словаре. В диалоговом режиме и в библиотеке сводки строятся при первом
+запросе state или county (около 50-90 мс), сервер строит их вместе с остальными индексами до первого запроса.
+
+Команда stats: выводит статистику запросов с момента запуска: для каждой команды - количество запросов, среднее время выполнения, гистограмму
+времени выполнения (количество запросов, выполненных не дольше 1, 2, 4, ... мкс) и самые частые почтовые индексы, города или пары индексов, а также
+заполнение кэша команды dist и долю попаданий в него, количество загруженных почтовых индексов и количество строк csv-файла, пропущенных из-за координат и из-за почтового индекса. Команда dist запоминает до 4096 последних вычисленных расстояний (пары индексов 12345 и 54321
+и 54321 и 12345 считаются одинаковыми). Списки почтовых индексов для команды zip упорядочиваются при построении данных.
+
+Команда reload: перезагружает csv-файл без перезапуска программы. Новый файл читается заново и сравнивается с загруженными данными по почтовому
+индексу; если данные изменились, для них заранее строятся индексы, которые уже использовались. Новые данные подменяют старые
+целиком после окончания перезагрузки, поэтому запросы никогда не видят частично изменённые данные. Результат - количество новых, изменённых
+и удалённых записей.
+
+Большой csv-файл читается по частям (по 8 МБ, границы частей - границы строк): части разбираются параллельно в нескольких процессах,
+затем их таблицы строк объединяются, а записи упорядочиваются по почтовому индексу. Строки с некорректными координатами и строки с некорректным
+почтовым индексом пропускаются; количество тех и других сохраняется в кэше и выводится командой stats отдельно. Поля csv-файла не должны содержать переводов строки.
+
 Команда end:  завершает работу программы.
 
 Если введённая команда не относится к списку допустимых команд, программа выводит сообщение об ошибке и продолжает работу.
@@ -31,12 +107,38 @@
 
 import csv
 import math
+import os
+import re
+import sys
+import time
+import json
+import asyncio
+import threading
+import mmap
+import struct
+import hashlib
+import contextlib
+from io import StringIO
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice, groupby
+from collections import OrderedDict, Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# NumPy нужен только для векторного вычисления расстояний, поэтому импорт необязательный
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Чтение данных из csv-файла
 
 def read_zip(filename):
-    data = []
+    return list(iter_zip(filename))
 
+# Чтение записей csv-файла по одной, без построения списка всех записей
+
+def iter_zip(filename):
     with open(filename, newline="", encoding="utf-8") as f:
         reader = csv.reader(f)
 
@@ -55,8 +157,7 @@ def read_zip(filename):
             except ValueError:
                 continue
             
-            data.append([zip_code, latitude, longtitude, city, state, county])
-    return data
+            yield [zip_code, latitude, longtitude, city, state, county]
 
 # Перевод координаты в градусы (мин и с)
 
@@ -75,6 +176,27 @@ def to_dms(value, direction_type):
 
     return f'{deg:03d}\u00B0{minutes:02d}\'{seconds:05.2f}"{dir_letter}'
 
+# Координата в формате to_dms: градусы, минуты и секунды (минуты и секунды необязательны) и буква направления
+dms_pattern = re.compile(r"(\d+(?:\.\d*)?)\s*\u00B0\s*(?:(\d+(?:\.\d*)?)\s*'\s*)?(?:(\d+(?:\.\d*)?)\s*\"\s*)?([NSEW])")
+
+# Перевод координаты из строки (десятичные градусы или формат to_dms) в градусы; ValueError при неверной строке
+def parse_coordinate(text, direction_type):
+    text = text.strip().upper()
+    limit = 90 if direction_type == 'lat' else 180
+    match = dms_pattern.fullmatch(text)
+    if match is None:
+        value = float(text)
+    else:
+        deg, minutes, seconds, dir_letter = match.groups()
+        if dir_letter not in ("NS" if direction_type == 'lat' else "EW"):
+            raise ValueError(f"invalid direction {dir_letter}")
+        value = float(deg) + float(minutes or 0) / 60 + float(seconds or 0) / 3600
+        if dir_letter in "SW":
+            value = -value
+    if not -limit <= value <= limit:
+        raise ValueError(f"coordinate out of range: {text}")
+    return value
+
 # Вычисление расстояния между двумя точками (в милях)
 def haversine_miles(lat1, lon1, lat2, lon2):
     r_km = 6371.0
@@ -91,6 +213,30 @@ def haversine_miles(lat1, lon1, lat2, lon2):
     km = r_km * c
     return km * 0.621371
 
+# Вычисление расстояний (в милях) от точки (lat, lon) до точек с координатами lats, lons по той же формуле,
+# что и haversine_miles. Если установлен NumPy, расстояния вычисляются для всех точек сразу
+def haversine_many(lat, lon, lats, lons):
+    if np is None:
+        return [haversine_miles(lat, lon, lat2, lon2) for lat2, lon2 in zip(lats, lons)]
+    return haversine_arrays(lat, lon, np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+
+# Вычисление расстояний (в милях) между точками массивов NumPy поэлементно (с учётом правил broadcasting:
+# например, для столбца lat1[:, None] и строки lat2[None, :] получается матрица расстояний)
+def haversine_arrays(lat1, lon1, lat2, lon2):
+    r_km = 6371.0
+    lat1 = np.radians(lat1)
+    lon1 = np.radians(lon1)
+    lat2 = np.radians(lat2)
+    lon2 = np.radians(lon2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * \
+        np.sin((lon2 - lon1) / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return r_km * c * 0.621371
+
+# Количество миль в одном градусе дуги большого круга
+miles_per_degree = 6371.0 * 0.621371 * math.pi / 180
+
 # Создание словарей для быстрого поиска по данным
 
 def indexes(data):
@@ -105,18 +251,1626 @@ def indexes(data):
         by_city_state.setdefault(key, []).append(zip_code)
     return by_zip, by_city_state
 
+# Скомпилированный кэш данных: файл рядом с csv-файлом, который отображается в память при запуске, поэтому
+# csv-файл не разбирается заново. Кэш перестраивается, если изменилось время изменения csv-файла и его хеш.
+#
+# Формат файла: заголовок (сигнатура, время изменения и размер csv-файла, хеш csv-файла, количество строк n,
+# количество строк в таблице строк m, количество строк csv-файла, пропущенных из-за координат и из-за почтового индекса),
+# затем столбцы: широта (double[n]), долгота (double[n]), почтовый индекс как число zip_to_int (uint32[n], по возрастанию), номера города, штата и округа в таблице строк (uint32[n] каждый),
+# номера строк, отсортированные по (город, штат, индекс) (uint32[n]), смещения строк в таблице (uint32[m + 1])
+# и сами строки в кодировке utf-8
+cache_magic = b"ZIPCACH3"
+cache_header = struct.Struct("<8sqq32sIIII")
+
+# Хеш содержимого файла
+def file_hash(filename):
+    h = hashlib.blake2b(digest_size=32)
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.digest()
+
+# Множитель для числового представления почтовых индексов: индекс из 5 цифр 12345 хранится как 12345 * zip_plus4_base,
+# индекс ZIP+4 12345-6789 (или 123456789) - как 12345 * zip_plus4_base + 6789 + 1. Числа помещаются в uint32 и
+# упорядочены так же, как индексы: 12345 < 12345-0000 < ... < 12345-9999 < 12346
+zip_plus4_base = 10001
+
+# Почтовый индекс в виде числа (None, если индекс не состоит из 5 цифр и не является индексом ZIP+4)
+def zip_to_int(zip_code):
+    if len(zip_code) == 5 and zip_code.isascii() and zip_code.isdigit():
+        return int(zip_code) * zip_plus4_base
+    if len(zip_code) == 10 and zip_code[5] == "-":
+        zip_code = zip_code[:5] + zip_code[6:]
+    if len(zip_code) == 9 and zip_code.isascii() and zip_code.isdigit():
+        return int(zip_code[:5]) * zip_plus4_base + int(zip_code[5:]) + 1
+    return None
+
+# Почтовый индекс из числа zip_to_int: 5 цифр или ZIP+4 в виде 12345-6789
+def int_to_zip(z):
+    zip5, plus4 = divmod(z, zip_plus4_base)
+    if plus4 == 0:
+        return f"{zip5:05d}"
+    return f"{zip5:05d}-{plus4 - 1:04d}"
+
+# Проверка, что строка является почтовым индексом (для поиска строки заголовка)
+def is_zip_code(text):
+    return zip_to_int(text) is not None
+
+# Ключ для поиска по городу и штату
+def city_state_key(city, state):
+    return (city.lower(), state.lower())
+
+# Данные в виде столбцов: для каждой записи хранятся координаты (array('d')), почтовый индекс как число (array('I'),
+# записи упорядочены по возрастанию индекса) и номера города, штата и округа в таблице строк strings, где каждая строка
+# хранится один раз. city_order - номера записей, упорядоченные по (город, штат, индекс). Поиск возвращает номера записей
+class ZipColumns:
+    def __init__(self, lat, lon, zips, city_ids, state_ids, county_ids, city_order, strings):
+        self.lat = lat
+        self.lon = lon
+        self.zips = zips
+        self.city_ids = city_ids
+        self.state_ids = state_ids
+        self.county_ids = county_ids
+        self.city_order = city_order
+        self.strings = strings
+        self.n = len(zips)
+        # Количество строк csv-файла, пропущенных при чтении: с некорректными координатами (или неполных)
+        # и с некорректным почтовым индексом
+        self.skipped = 0
+        self.bad_zips = 0
+        self.grid = None
+        self.cities = None
+        self.groups = None
+        self.dist_cache = LRUCache(dist_cache_size)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.n
+
+    # Строка из таблицы строк
+    def string(self, i):
+        return self.strings[i]
+
+    # Вся таблица строк в виде списка
+    def all_strings(self):
+        return list(self.strings)
+
+    # Почтовый индекс записи i в виде строки
+    def zip_code(self, i):
+        return int_to_zip(self.zips[i])
+
+    # Запись i в том же виде, что и в списке data: [индекс, широта, долгота, город, штат, округ]
+    def row(self, i):
+        return [
+            self.zip_code(i),
+            self.lat[i],
+            self.lon[i],
+            self.string(self.city_ids[i]),
+            self.string(self.state_ids[i]),
+            self.string(self.county_ids[i])
+        ]
+
+    # Номер записи по почтовому индексу (None, если индекс не найден). Если индекс повторяется в csv-файле, используется
+    # последняя запись (записи с одинаковым индексом хранятся в порядке файла)
+    def find_zip(self, zip_code):
+        z = zip_to_int(zip_code)
+        if z is None:
+            return None
+        i = bisect_right(self.zips, z) - 1
+        if i >= 0 and self.zips[i] == z:
+            return i
+        return None
+
+    # Расстояние между записями i1 и i2 (в милях). Результаты запоминаются в кэше dist_cache по неупорядоченной паре
+    # номеров записей, поэтому расстояния для (i1, i2) и (i2, i1) совпадают
+    def distance(self, i1, i2):
+        key = (i1, i2) if i1 <= i2 else (i2, i1)
+        d = self.dist_cache.get(key)
+        if d is None:
+            d = haversine_miles(self.lat[key[0]], self.lon[key[0]], self.lat[key[1]], self.lon[key[1]])
+            self.dist_cache.put(key, d)
+        return d
+
+    # Ближайшая к точке (lat, lon) запись: пара (расстояние в милях, номер записи) или None, если данных нет
+    def nearest_row(self, lat, lon):
+        found = self.spatial_index().nearest(lat, lon, 1)
+        return found[0] if found else None
+
+    # Ближайшие записи к точкам с координатами lats, lons (см. GridIndex.nearest_many)
+    def nearest_rows(self, lats, lons):
+        return self.spatial_index().nearest_many(lats, lons)
+
+    # Ключ (город, штат) записи i в нижнем регистре
+    def city_state(self, i):
+        return city_state_key(self.string(self.city_ids[i]), self.string(self.state_ids[i]))
+
+    # Пространственный индекс (строится при первом обращении)
+    def spatial_index(self):
+        if self.grid is None:
+            with self.lock:
+                if self.grid is None:
+                    self.grid = GridIndex(self)
+        return self.grid
+
+    # Индекс названий городов для поиска по началу названия и с опечатками (строится при первом обращении)
+    def city_index(self):
+        if self.cities is None:
+            with self.lock:
+                if self.cities is None:
+                    self.cities = CityIndex(self)
+        return self.cities
+
+    # Сводки по штатам и округам (строятся при первом обращении)
+    def group_index(self):
+        if self.groups is None:
+            with self.lock:
+                if self.groups is None:
+                    self.groups = GroupIndex(self)
+        return self.groups
+
+    # Номера записей по ключу (город, штат) в нижнем регистре, по возрастанию индекса
+    def find_city_state(self, key):
+        start = bisect_left(self.city_order, key, key=self.city_state)
+        rows = []
+        for j in range(start, self.n):
+            i = self.city_order[j]
+            if self.city_state(i) != key:
+                break
+            rows.append(i)
+        return rows
+
+# Количество расстояний в кэше команды dist
+dist_cache_size = 4096
+
+# Кэш с вытеснением давно не использовавшихся значений (LRU) и счётчиками попаданий и промахов.
+# Может использоваться из нескольких потоков
+class LRUCache:
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # Значение по ключу (None, если его нет в кэше)
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            if len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    # Состояние кэша: размер, заполнение, попадания, промахи и доля попаданий
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": self.size, "used": len(self.items), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+# Границы интервалов гистограммы времени выполнения запросов (в микросекундах): до 1, 2, 4, ... мкс
+latency_buckets = [2 ** k for k in range(21)]
+
+# Количество самых частых ключей в статистике и наибольшее количество хранимых ключей одной команды
+stats_top_size = 10
+stats_max_keys = 10000
+
+# Статистика запросов: количество и суммарное время выполнения по командам, гистограммы времени выполнения и
+# количество запросов по ключам (почтовый индекс, город и штат, пара индексов) для поиска самых частых ключей.
+# Может использоваться из нескольких потоков
+class QueryStats:
+    def __init__(self):
+        self.counts = {}
+        self.seconds = {}
+        self.histograms = {}
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    # Измерение времени выполнения запроса команды cmd с ключом key (контекстный менеджер)
+    @contextlib.contextmanager
+    def measure(self, cmd, key=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(cmd, key, time.perf_counter() - start)
+
+    def add(self, cmd, key, seconds):
+        with self.lock:
+            self.counts[cmd] = self.counts.get(cmd, 0) + 1
+            self.seconds[cmd] = self.seconds.get(cmd, 0.0) + seconds
+            histogram = self.histograms.setdefault(cmd, [0] * (len(latency_buckets) + 1))
+            histogram[bisect_left(latency_buckets, seconds * 1e6)] += 1
+            if key is not None:
+                keys = self.keys.setdefault(cmd, Counter())
+                keys[key] += 1
+                # Редкие ключи отбрасываются, чтобы статистика не росла без ограничений
+                if len(keys) > stats_max_keys:
+                    self.keys[cmd] = Counter(dict(keys.most_common(stats_max_keys // 2)))
+
+    # Статистика в виде словаря: для каждой команды количество запросов, среднее время (мкс), гистограмма
+    # (верхняя граница интервала в мкс -> количество запросов, последний интервал - "inf") и самые частые ключи
+    def snapshot(self):
+        result = {}
+        labels = [str(bound) for bound in latency_buckets] + ["inf"]
+        with self.lock:
+            for cmd in sorted(self.counts):
+                result[cmd] = {
+                    "count": self.counts[cmd],
+                    "mean_us": self.seconds[cmd] / self.counts[cmd] * 1e6,
+                    "histogram": {label: n for label, n in zip(labels, self.histograms[cmd]) if n},
+                    "top": self.keys[cmd].most_common(stats_top_size) if cmd in self.keys else []
+                }
+        return result
+
+# Статистика запросов процесса
+query_stats = QueryStats()
+
+# Ключ статистики для пары почтовых индексов (не зависит от порядка индексов)
+def pair_key(z1, z2):
+    return f"{z1}-{z2}" if z1 <= z2 else f"{z2}-{z1}"
+
+# Статистика запросов и кэша расстояний в виде строк для вывода
+def format_stats(columns):
+    lines = []
+    for cmd, data in query_stats.snapshot().items():
+        lines.append(f"{cmd}: {data['count']} request(s), mean {data['mean_us']:.1f} us")
+        lines.append("  latency: " + ", ".join(f"<={label} us: {n}" if label != "inf" else f">{latency_buckets[-1]} us: {n}"
+                                               for label, n in data["histogram"].items()))
+        if data["top"]:
+            lines.append("  top keys: " + ", ".join(f"{key} ({n})" for key, n in data["top"]))
+    cache = columns.dist_cache.stats()
+    lines.append(f"dist cache: {cache['used']}/{cache['size']} entries, {cache['hits']} hit(s), {cache['misses']} miss(es), "
+                 f"hit rate {cache['hit_rate']:.1%}")
+    lines.append(f"dataset: {columns.n} zip code(s), {columns.skipped} csv row(s) with invalid coordinates, "
+                 f"{columns.bad_zips} csv row(s) with invalid zip codes")
+    return lines
+
+# Размер ячейки сетки пространственного индекса (в градусах)
+grid_cell_degrees = 1.0
+
+# Пространственный индекс: записи разложены по ячейкам сетки широта/долгота. Для поиска в радиусе R миль
+# расстояния вычисляются только до записей из ячеек, пересекающих прямоугольник вокруг точки
+class GridIndex:
+    def __init__(self, columns):
+        self.columns = columns
+        cells = {}
+        for i in range(columns.n):
+            cells.setdefault(self.cell(columns.lat[i], columns.lon[i]), array("I")).append(i)
+        self.cells = cells
+        self.columns_count = round(360 / grid_cell_degrees)
+
+    # Ячейка сетки для точки (lat, lon)
+    @staticmethod
+    def cell(lat, lon):
+        return (math.floor(lat / grid_cell_degrees), math.floor(lon / grid_cell_degrees))
+
+    # Номера записей из ячеек, которые могут содержать точки не дальше miles миль от точки (lat, lon)
+    def candidates(self, lat, lon, miles):
+        # Больше 180 градусов по широте от точки до любой другой точки не бывает
+        dlat = min(miles / miles_per_degree, 180)
+        lat_max = abs(lat) + dlat
+        half = self.columns_count // 2
+        if lat_max >= 90:
+            lon_cells = range(-half, half)
+        else:
+            dlon = dlat / math.cos(math.radians(lat_max))
+            c0 = math.floor((lon - dlon) / grid_cell_degrees)
+            c1 = math.floor((lon + dlon) / grid_cell_degrees)
+            if c1 - c0 + 1 >= self.columns_count:
+                lon_cells = range(-half, half)
+            else:
+                lon_cells = [(c + half) % self.columns_count - half for c in range(c0, c1 + 1)]
+
+        rows = array("I")
+        # Ряды ячеек ограничены полюсами
+        r0 = max(math.floor((lat - dlat) / grid_cell_degrees), math.floor(-90 / grid_cell_degrees))
+        r1 = min(math.floor((lat + dlat) / grid_cell_degrees), math.floor(90 / grid_cell_degrees))
+        for r in range(r0, r1 + 1):
+            for c in lon_cells:
+                cell = self.cells.get((r, c))
+                if cell is not None:
+                    rows.extend(cell)
+        return rows
+
+    # Записи не дальше miles миль от точки (lat, lon): список пар (расстояние, номер записи) по возрастанию расстояния
+    def radius(self, lat, lon, miles):
+        rows = self.candidates(lat, lon, miles)
+        if not rows:
+            return []
+        lat_column = self.columns.lat
+        lon_column = self.columns.lon
+        if np is not None:
+            index = np.frombuffer(rows, dtype=np.uint32)
+            lats = np.frombuffer(lat_column, dtype=np.float64)[index]
+            lons = np.frombuffer(lon_column, dtype=np.float64)[index]
+            distances = haversine_many(lat, lon, lats, lons)
+            inside = np.nonzero(distances <= miles)[0]
+            order = inside[np.lexsort((index[inside], distances[inside]))]
+            return [(float(distances[j]), int(index[j])) for j in order]
+        distances = haversine_many(lat, lon, [lat_column[i] for i in rows], [lon_column[i] for i in rows])
+        return sorted((d, i) for d, i in zip(distances, rows) if d <= miles)
+
+    # count ближайших записей к точке (lat, lon): радиус поиска удваивается, пока в нём не окажется
+    # достаточно записей; все записи ближе найденных находятся внутри этого радиуса
+    def nearest(self, lat, lon, count, miles=10.0):
+        count = min(count, self.columns.n)
+        while True:
+            found = self.radius(lat, lon, miles)
+            if len(found) >= count or miles >= 180 * miles_per_degree:
+                return found[:count]
+            miles *= 2
+
+    # Ближайшие записи для многих точек (массивы lats, lons): список пар (расстояние, номер записи) или None для каждой
+    # точки. Точки группируются по ячейкам сетки; для каждой ячейки один раз выбираются записи, которые могут оказаться
+    # не дальше miles миль от любой точки ячейки, и расстояния до них вычисляются матрицей NumPy частями по
+    # batch_chunk_size. Для точек, у которых в радиусе miles записей нет, поиск повторяется с удвоенным радиусом
+    def nearest_many(self, lats, lons, miles=25.0):
+        if np is None:
+            result = [self.nearest(lat, lon, 1) for lat, lon in zip(lats, lons)]
+            return [found[0] if found else None for found in result]
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        distances = np.zeros(len(lats))
+        rows = np.full(len(lats), -1, dtype=np.int64)
+        lat_column = np.frombuffer(self.columns.lat, dtype=np.float64)
+        lon_column = np.frombuffer(self.columns.lon, dtype=np.float64)
+        cell_rows = np.floor(lats / grid_cell_degrees).astype(np.int64)
+        cell_columns = np.floor(lons / grid_cell_degrees).astype(np.int64)
+
+        pending = np.arange(len(lats))
+        while len(pending) > 0:
+            # При радиусе в половину окружности Земли в поиск попадают все записи
+            last = miles >= 180 * miles_per_degree
+            order = pending[np.lexsort((cell_columns[pending], cell_rows[pending]))]
+            changes = (np.diff(cell_rows[order]) != 0) | (np.diff(cell_columns[order]) != 0)
+            retry = []
+            for group in np.split(order, np.nonzero(changes)[0] + 1):
+                r = int(cell_rows[group[0]])
+                c = int(cell_columns[group[0]])
+                lat0 = (r + 0.5) * grid_cell_degrees
+                lon0 = (c + 0.5) * grid_cell_degrees
+                # Наибольшее расстояние от центра ячейки до её точек (до одного из углов)
+                reach = max(haversine_miles(lat0, lon0, r * grid_cell_degrees, c * grid_cell_degrees),
+                            haversine_miles(lat0, lon0, (r + 1) * grid_cell_degrees, c * grid_cell_degrees))
+                # Записи упорядочены по номеру, чтобы при равных расстояниях выбиралась запись с меньшим номером, как в nearest
+                candidates = np.sort(np.frombuffer(self.candidates(lat0, lon0, miles + reach), dtype=np.uint32))
+                if len(candidates) == 0:
+                    if not last:
+                        retry.append(group)
+                    continue
+                candidate_lats = lat_column[candidates][None, :]
+                candidate_lons = lon_column[candidates][None, :]
+                step = max(1, batch_chunk_size // len(candidates))
+                for start in range(0, len(group), step):
+                    part = group[start:start + step]
+                    matrix = haversine_arrays(lats[part][:, None], lons[part][:, None], candidate_lats, candidate_lons)
+                    best = np.argmin(matrix, axis=1)
+                    distances[part] = matrix[np.arange(len(part)), best]
+                    rows[part] = candidates[best]
+                    if not last:
+                        retry.append(part[distances[part] > miles])
+            pending = np.concatenate(retry) if retry else pending[:0]
+            miles *= 2
+
+        return [(d, i) if i >= 0 else None for d, i in zip(distances.tolist(), rows.tolist())]
+
+# Количество названий, для которых вычисляется расстояние Левенштейна при поиске с опечатками
+fuzzy_candidates = 32
+
+# Триграммы названия (с пробелами в начале и в конце, чтобы учитывались первые и последние буквы)
+def trigrams(name):
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# Расстояние Левенштейна между строками a и b; если оно больше limit, возвращается limit + 1
+def edit_distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        left = best = i
+        for j, cb in enumerate(b, 1):
+            value = previous[j - 1] + (ca != cb)
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if left + 1 < value:
+                value = left + 1
+            current.append(value)
+            left = value
+            if value < best:
+                best = value
+        if best > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+# Индекс названий городов: ключи (город, штат) в порядке city_order, отсортированный список различных названий
+# (поиск по началу названия - двоичным поиском диапазона) и списки названий для каждой триграммы (поиск с опечатками:
+# расстояние Левенштейна вычисляется только для названий, имеющих достаточно общих триграмм с запросом)
+class CityIndex:
+    def __init__(self, columns):
+        self.columns = columns
+        self.keys = []
+        self.starts = array("I")
+        previous = None
+        for j in range(columns.n):
+            key = columns.city_state(columns.city_order[j])
+            if key != previous:
+                self.keys.append(key)
+                self.starts.append(j)
+                previous = key
+        self.starts.append(columns.n)
+
+        # Различные названия и номер первого ключа для каждого названия
+        self.names = []
+        self.name_starts = array("I")
+        for k, key in enumerate(self.keys):
+            if not self.names or self.names[-1] != key[0]:
+                self.names.append(key[0])
+                self.name_starts.append(k)
+        self.name_starts.append(len(self.keys))
+
+        grams = {}
+        self.gram_counts = array("I")
+        for m, name in enumerate(self.names):
+            name_grams = trigrams(name)
+            self.gram_counts.append(len(name_grams))
+            for gram in name_grams:
+                grams.setdefault(gram, array("I")).append(m)
+        self.grams = grams
+
+    # Номера записей ключа k
+    def rows(self, k):
+        return self.columns.city_order[self.starts[k]:self.starts[k + 1]]
+
+    # Подсказка для ключа k: (город, штат, количество почтовых индексов) в исходном написании
+    def suggestion(self, k):
+        i = self.columns.city_order[self.starts[k]]
+        return (self.columns.string(self.columns.city_ids[i]), self.columns.string(self.columns.state_ids[i]),
+                self.starts[k + 1] - self.starts[k])
+
+    # Номера названий, близких к name (с учётом опечаток): словарь номер названия -> расстояние Левенштейна
+    def fuzzy(self, name):
+        limit = max(1, len(name) // 4)
+        query_grams = trigrams(name)
+        postings = [self.grams[gram] for gram in query_grams if gram in self.grams]
+        if not postings:
+            return {}
+        # Каждая правка меняет не больше трёх триграмм, поэтому у близких названий общих триграмм не меньше, чем
+        # триграмм в более длинном из названий без 3 * limit. Из подходящих названий расстояние Левенштейна
+        # вычисляется только для fuzzy_candidates названий с наибольшим количеством общих триграмм
+        if np is not None:
+            counts = np.bincount(np.concatenate([np.frombuffer(p, dtype=np.uint32) for p in postings]), minlength=len(self.names))
+            threshold = np.maximum(max(1, len(query_grams) - 3 * limit),
+                                   np.frombuffer(self.gram_counts, dtype=np.uint32).astype(np.int64) - 3 * limit)
+            candidates = np.nonzero(counts >= threshold)[0]
+            if len(candidates) > fuzzy_candidates:
+                candidates = candidates[np.argsort(-counts[candidates], kind="stable")[:fuzzy_candidates]]
+            candidates = candidates.tolist()
+        else:
+            counts = {}
+            for p in postings:
+                for m in p:
+                    counts[m] = counts.get(m, 0) + 1
+            candidates = [m for m, count in counts.items()
+                          if count >= max(1, len(query_grams) - 3 * limit, self.gram_counts[m] - 3 * limit)]
+            candidates = sorted(candidates, key=lambda m: (-counts[m], m))[:fuzzy_candidates]
+
+        found = {}
+        for m in candidates:
+            distance = edit_distance(name, self.names[m], limit)
+            if distance <= limit:
+                found[m] = distance
+        return found
+
+    # Подсказки для названия города (полного, начала названия или с опечатками) и, если указан, штата: не больше limit
+    # кортежей (город, штат, количество почтовых индексов). Сначала точные совпадения, затем названия, начинающиеся с
+    # введённого (более короткие раньше), затем названия с опечатками (с меньшим расстоянием раньше); при равенстве -
+    # города с большим количеством почтовых индексов
+    def suggest(self, name, state=None, limit=10):
+        error = near_value_error("city", limit)
+        if error is not None:
+            raise ValueError(error)
+        name = name.strip().lower()
+        state = state.strip().lower() if state else None
+        if not name:
+            return []
+        ranks = {}
+        start = bisect_left(self.names, name)
+        end = bisect_left(self.names, name + "\U0010ffff")
+        for m in range(start, end):
+            ranks[m] = (0, 0) if self.names[m] == name else (1, len(self.names[m]) - len(name))
+        # Названия с опечатками идут после совпадений по началу названия, поэтому ищутся, только если совпадений мало
+        if end - start < limit or state is not None:
+            for m, distance in self.fuzzy(name).items():
+                if m not in ranks:
+                    ranks[m] = (2, distance)
+
+        # Названия перебираются группами с одинаковым рангом, пока не наберётся limit подсказок
+        found = []
+        for rank, group in groupby(sorted(ranks, key=ranks.get), key=ranks.get):
+            keys = []
+            for m in group:
+                for k in range(self.name_starts[m], self.name_starts[m + 1]):
+                    if state is None or self.keys[k][1] == state:
+                        keys.append((-(self.starts[k + 1] - self.starts[k]), self.keys[k], k))
+            found.extend(sorted(keys))
+            if len(found) >= limit:
+                break
+        return [self.suggestion(k) for *_, k in found[:limit]]
+
+# Подсказки в виде строки "город, штат (количество почтовых индексов)" через точку с запятой
+def format_suggestions(suggestions):
+    return "; ".join(f"{city}, {state} ({count} zip code(s))" for city, state, count in suggestions)
+
+# Сводки по группам записей: для каждого кода группы codes[i] - количество записей, центр (среднее единичных векторов
+# точек на сфере, переведённое обратно в широту и долготу, поэтому группы по обе стороны 180-го меридиана не смещаются)
+# и границы (наименьшие и наибольшие широта и долгота). Возвращает словарь код -> сводка в виде словаря с полями
+# count, centroid ([широта, долгота]) и bbox ([мин. широта, мин. долгота, макс. широта, макс. долгота])
+def summarize_groups(lat, lon, codes):
+    if np is not None:
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        unique, inverse = np.unique(np.asarray(codes, dtype=np.int64), return_inverse=True)
+        phi = np.radians(lat)
+        lam = np.radians(lon)
+        counts = np.bincount(inverse, minlength=len(unique))
+        sums = [np.bincount(inverse, weights, minlength=len(unique))
+                for weights in (np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi))]
+        bounds = []
+        for values, initial, reduce in ((lat, np.inf, np.minimum), (lon, np.inf, np.minimum),
+                                        (lat, -np.inf, np.maximum), (lon, -np.inf, np.maximum)):
+            bound = np.full(len(unique), initial)
+            reduce.at(bound, inverse, values)
+            bounds.append(bound.tolist())
+        groups = zip(unique.tolist(), counts.tolist(), *(total.tolist() for total in sums), *bounds)
+    else:
+        totals = {}
+        for la, lo, code in zip(lat, lon, codes):
+            phi = math.radians(la)
+            lam = math.radians(lo)
+            total = totals.get(code)
+            if total is None:
+                total = totals[code] = [0, 0.0, 0.0, 0.0, la, lo, la, lo]
+            total[0] += 1
+            total[1] += math.cos(phi) * math.cos(lam)
+            total[2] += math.cos(phi) * math.sin(lam)
+            total[3] += math.sin(phi)
+            total[4] = min(total[4], la)
+            total[5] = min(total[5], lo)
+            total[6] = max(total[6], la)
+            total[7] = max(total[7], lo)
+        groups = ((code, *total) for code, total in sorted(totals.items()))
+
+    result = {}
+    for code, count, x, y, z, min_lat, min_lon, max_lat, max_lon in groups:
+        centroid = [math.degrees(math.atan2(z, math.hypot(x, y))), math.degrees(math.atan2(y, x))]
+        result[code] = {"count": count, "centroid": centroid, "bbox": [min_lat, min_lon, max_lat, max_lon]}
+    return result
+
+# Сводки по штатам и по парам (штат, округ): количество почтовых индексов, центр и границы. Строятся за один проход по
+# столбцам, после чего ответ на запрос - поиск в словаре. Названия сравниваются без учёта регистра
+class GroupIndex:
+    def __init__(self, columns):
+        table = columns.all_strings()
+        # Номер строки в нижнем регистре для каждой строки таблицы (строки, различающиеся только регистром, совпадают)
+        lower_ids = {}
+        canonical = [lower_ids.setdefault(value.lower(), k) for k, value in enumerate(table)]
+        state_codes = [canonical[k] for k in columns.state_ids]
+        county_codes = [state * len(table) + canonical[k] for state, k in zip(state_codes, columns.county_ids)]
+
+        self.states = {}
+        for code, summary in summarize_groups(columns.lat, columns.lon, state_codes).items():
+            summary["state"] = table[code]
+            summary["counties"] = 0
+            self.states[table[code].lower()] = summary
+        self.counties = {}
+        self.state_counties = {}
+        for code, summary in summarize_groups(columns.lat, columns.lon, county_codes).items():
+            state, county = divmod(code, len(table))
+            summary["state"] = table[state]
+            summary["county"] = table[county]
+            key = (table[state].lower(), table[county].lower())
+            self.counties[key] = summary
+            self.state_counties.setdefault(key[0], []).append(key)
+            self.states[key[0]]["counties"] += 1
+        for keys in self.state_counties.values():
+            keys.sort()
+
+    # Сводка по штату (None, если штат не найден)
+    def state(self, state):
+        return self.states.get(state.strip().lower())
+
+    # Сводка по округу штата (None, если округ не найден)
+    def county(self, state, county):
+        return self.counties.get((state.strip().lower(), county.strip().lower()))
+
+    # Сводки по всем округам штата, упорядоченные по названию округа (пустой список, если штат не найден)
+    def state_county_list(self, state):
+        return [self.counties[key] for key in self.state_counties.get(state.strip().lower(), [])]
+
+# Сводка по записям rows (например, по почтовым индексам одного города) в том же виде, что и в GroupIndex
+# (None, если записей нет)
+def rows_summary(columns, rows):
+    if not rows:
+        return None
+    return summarize_groups([columns.lat[i] for i in rows], [columns.lon[i] for i in rows], [0] * len(rows))[0]
+
+# Сводка в виде строки: количество почтовых индексов, центр и границы
+def format_summary(summary):
+    min_lat, min_lon, max_lat, max_lon = summary["bbox"]
+    lat, lon = summary["centroid"]
+    return (f"{summary['count']} zip code(s), centroid ({to_dms(lat, 'lat')}, {to_dms(lon, 'lon')}), "
+            f"bounding box ({to_dms(min_lat, 'lat')}, {to_dms(min_lon, 'lon')}) - ({to_dms(max_lat, 'lat')}, {to_dms(max_lon, 'lon')})")
+
+# Размер части csv-файла для параллельного чтения (в байтах) и количество процессов (None - по количеству ядер)
+ingest_chunk_bytes = 8 << 20
+ingest_workers = None
+
+# Границы частей csv-файла (пары смещений в байтах) без строки заголовка; каждая часть начинается с начала строки.
+# Поля csv-файла не содержат переводов строки, поэтому граница строки файла - граница записи
+def chunk_ranges(filename, chunk_bytes):
+    size = os.path.getsize(filename)
+    ranges = []
+    with open(filename, "rb") as f:
+        f.readline()
+        start = f.tell()
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            if f.tell() < size:
+                f.readline()
+            end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+# Разбор части csv-файла (выполняется в процессе-исполнителе): возвращает столбцы широт, долгот, почтовых индексов и
+# номеров города, штата и округа в таблице строк части, саму таблицу строк, количество строк с некорректными
+# координатами (или неполных) и количество строк с некорректным почтовым индексом. Пропускаются те же строки,
+# что и в iter_zip, а также строки с некорректным почтовым индексом
+def parse_chunk(filename, start, end):
+    with open(filename, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8")
+    strings = {}
+    lat = array("d")
+    lon = array("d")
+    zips = array("I")
+    city_ids = array("I")
+    state_ids = array("I")
+    county_ids = array("I")
+    skipped = 0
+    bad_zips = 0
+    for row in csv.reader(StringIO(text, newline="")):
+        if not row:
+            continue
+        if len(row) < 6 or row[1] == "" or row[2] == "":
+            skipped += 1
+            continue
+        try:
+            latitude = float(row[1])
+            longtitude = float(row[2])
+        except ValueError:
+            skipped += 1
+            continue
+        z = zip_to_int(row[0])
+        if z is None:
+            bad_zips += 1
+            continue
+        lat.append(latitude)
+        lon.append(longtitude)
+        zips.append(z)
+        city_ids.append(strings.setdefault(row[3], len(strings)))
+        state_ids.append(strings.setdefault(row[4], len(strings)))
+        county_ids.append(strings.setdefault(row[5], len(strings)))
+    return lat, lon, zips, city_ids, state_ids, county_ids, list(strings), skipped, bad_zips
+
+# Чтение csv-файла в столбцы по частям: части разбираются параллельно в нескольких процессах (если частей больше одной),
+# затем объединяются: таблицы строк частей сливаются в общую, столбцы упорядочиваются по почтовому индексу (с NumPy -
+# векторно; записи с одинаковым индексом остаются в порядке файла), порядок city_order - по (город, штат, индекс).
+# Количество пропущенных строк - в полях skipped и bad_zips
+def ingest_columns(filename, workers=None, chunk_bytes=None):
+    ranges = chunk_ranges(filename, chunk_bytes or ingest_chunk_bytes)
+    if len(ranges) > 1 and (workers or ingest_workers or os.cpu_count() or 1) > 1:
+        with ProcessPoolExecutor(max_workers=workers or ingest_workers) as executor:
+            parts = list(executor.map(parse_chunk, [filename] * len(ranges), *zip(*ranges)))
+    else:
+        parts = [parse_chunk(filename, start, end) for start, end in ranges]
+
+    table = []
+    strings = {}
+    lat = array("d")
+    lon = array("d")
+    zips = array("I")
+    city_ids = array("I")
+    state_ids = array("I")
+    county_ids = array("I")
+    skipped = 0
+    bad_zips = 0
+    for (part_lat, part_lon, part_zips, part_city_ids, part_state_ids, part_county_ids, part_strings,
+         part_skipped, part_bad_zips) in parts:
+        # Номера строк части переводятся в номера общей таблицы
+        translate = array("I")
+        for value in part_strings:
+            if value not in strings:
+                strings[value] = len(table)
+                table.append(value)
+            translate.append(strings[value])
+        lat.extend(part_lat)
+        lon.extend(part_lon)
+        zips.extend(part_zips)
+        for ids, part_ids in ((city_ids, part_city_ids), (state_ids, part_state_ids), (county_ids, part_county_ids)):
+            if np is not None:
+                ids.frombytes(np.frombuffer(translate, dtype=np.uint32)[np.frombuffer(part_ids, dtype=np.uint32)].tobytes())
+            else:
+                ids.extend(translate[k] for k in part_ids)
+        skipped += part_skipped
+        bad_zips += part_bad_zips
+
+    # Упорядочивание по почтовому индексу (с сохранением порядка строк файла при равных индексах) и по (город, штат, индекс)
+    if np is not None:
+        order = np.argsort(np.frombuffer(zips, dtype=np.uint32), kind="stable")
+        lat, lon, zips, city_ids, state_ids, county_ids = (
+            array(column.typecode, np.frombuffer(column, dtype=column.typecode)[order].tobytes())
+            for column in (lat, lon, zips, city_ids, state_ids, county_ids)
+        )
+        # Номер строки таблицы в порядке строк в нижнем регистре (одинаковые в нижнем регистре строки получают один номер)
+        lower = [value.lower() for value in table]
+        ranks = {value: k for k, value in enumerate(sorted(set(lower)))}
+        rank = np.array([ranks[value] for value in lower], dtype=np.int64)
+        city_order = np.lexsort((np.frombuffer(zips, dtype=np.uint32), rank[np.frombuffer(state_ids, dtype=np.uint32)],
+                                 rank[np.frombuffer(city_ids, dtype=np.uint32)]))
+        city_order = array("I", city_order.astype(np.uint32).tobytes())
+    else:
+        order = sorted(range(len(zips)), key=zips.__getitem__)
+        lat, lon, zips, city_ids, state_ids, county_ids = (
+            array(column.typecode, (column[i] for i in order))
+            for column in (lat, lon, zips, city_ids, state_ids, county_ids)
+        )
+        keys = [city_state_key(table[city_ids[i]], table[state_ids[i]]) for i in range(len(zips))]
+        city_order = array("I", sorted(range(len(zips)), key=keys.__getitem__))
+
+    columns = ZipColumns(lat, lon, zips, city_ids, state_ids, county_ids, city_order, table)
+    columns.skipped = skipped
+    columns.bad_zips = bad_zips
+    return columns
+
+# Запись кэша для столбцов columns, построенных из csv-файла с параметрами stat и хешем digest
+def write_cache(columns, cache_file, stat, digest):
+    blob = bytearray()
+    offsets = array("I", [0])
+    for value in columns.all_strings():
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+
+    tmp_file = cache_file + ".tmp"
+    try:
+        with open(tmp_file, "wb") as f:
+            f.write(cache_header.pack(cache_magic, stat.st_mtime_ns, stat.st_size, digest, columns.n, len(offsets) - 1,
+                                      columns.skipped, columns.bad_zips))
+            for column in (columns.lat, columns.lon, columns.zips, columns.city_ids, columns.state_ids, columns.county_ids,
+                           columns.city_order, offsets):
+                f.write(column)
+            f.write(blob)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_file)
+        raise
+
+# Обновление времени изменения и размера csv-файла в заголовке кэша, если кэш построен из csv-файла с хешем digest
+# (содержимое csv-файла не изменилось). Возвращает False, если кэш построен из другого файла
+def touch_cache(cache_file, stat, digest):
+    if not os.path.exists(cache_file):
+        return False
+    with open(cache_file, "r+b") as f:
+        magic, mtime_ns, size, cache_digest, n, m, skipped, bad_zips = cache_header.unpack(f.read(cache_header.size))
+        if magic != cache_magic or cache_digest != digest:
+            return False
+        f.seek(0)
+        f.write(cache_header.pack(cache_magic, stat.st_mtime_ns, stat.st_size, digest, n, m, skipped, bad_zips))
+    return True
+
+# Данные из кэша: столбцы читаются напрямую из отображённого в память файла, строки декодируются при обращении
+class ZipCache(ZipColumns):
+    def __init__(self, cache_file):
+        with open(cache_file, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.mtime_ns, self.size, self.digest, n, m, skipped, bad_zips = cache_header.unpack_from(self.mm)
+        if magic != cache_magic:
+            raise ValueError(f"{cache_file} не является файлом кэша")
+
+        view = memoryview(self.mm)
+        pos = cache_header.size
+        columns = []
+        for code, count in (("d", n), ("d", n), ("I", n), ("I", n), ("I", n), ("I", n), ("I", n), ("I", m + 1)):
+            size = count * struct.calcsize(code)
+            columns.append(view[pos:pos + size].cast(code))
+            pos += size
+        self.offsets = columns.pop()
+        self.blob = view[pos:]
+        super().__init__(*columns, None)
+        self.skipped = skipped
+        self.bad_zips = bad_zips
+
+    def string(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def all_strings(self):
+        return [self.string(i) for i in range(len(self.offsets) - 1)]
+
+# Поиск по почтовому индексу в столбцах (работает как словарь by_zip)
+class ZipIndex:
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __contains__(self, zip_code):
+        return self.columns.find_zip(zip_code) is not None
+
+    def __getitem__(self, zip_code):
+        i = self.columns.find_zip(zip_code)
+        if i is None:
+            raise KeyError(zip_code)
+        return self.columns.row(i)
+
+# Поиск по городу и штату в столбцах (работает как словарь by_city_state)
+class CityStateIndex:
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __contains__(self, key):
+        return len(self.columns.find_city_state(key)) > 0
+
+    def __getitem__(self, key):
+        rows = self.columns.find_city_state(key)
+        if not rows:
+            raise KeyError(key)
+        return [self.columns.zip_code(i) for i in rows]
+
+# Имя файла кэша для csv-файла filename
+def default_cache_file(filename):
+    return os.path.splitext(filename)[0] + ".cache"
+
+# Открытие кэша для csv-файла filename; кэш строится заново, если csv-файл изменился. Возвращает данные и время
+# изменения, размер и хеш csv-файла, из которого они получены. Если кэш нельзя записать (например, каталог доступен
+# только для чтения), используются данные, прочитанные из csv-файла в память
+def open_cache(filename, cache_file=None):
+    if cache_file is None:
+        cache_file = default_cache_file(filename)
+    stat = os.stat(filename)
+
+    cache = None
+    if os.path.exists(cache_file):
+        try:
+            cache = ZipCache(cache_file)
+        except (OSError, ValueError, struct.error):
+            cache = None
+    if cache is not None and cache.mtime_ns == stat.st_mtime_ns and cache.size == stat.st_size:
+        return cache, (cache.mtime_ns, cache.size, cache.digest)
+
+    digest = file_hash(filename)
+    source = (stat.st_mtime_ns, stat.st_size, digest)
+    if cache is not None and cache.digest == digest:
+        # Файл не изменился, изменилось только время изменения: обновляется заголовок кэша
+        try:
+            touch_cache(cache_file, stat, digest)
+        except OSError:
+            return cache, source
+        return ZipCache(cache_file), source
+
+    columns = ingest_columns(filename)
+    try:
+        write_cache(columns, cache_file, stat, digest)
+    except OSError:
+        return columns, source
+    return ZipCache(cache_file), source
+
+# Количество расстояний, вычисляемых за один раз в пакетном режиме (ограничивает расход памяти)
+batch_chunk_size = 1 << 16
+
+# Открытие файла для пакетного режима ("-" - стандартный ввод или вывод)
+def open_batch_file(filename, mode):
+    if filename == "-":
+        return contextlib.nullcontext(sys.stdin if mode == "r" else sys.stdout)
+    return open(filename, mode, newline="", encoding="utf-8")
+
+# Чтение строк csv-файла для пакетного режима: пустые строки и строка заголовка (первое поле которой не почтовый индекс) пропускаются
+def read_batch_rows(f, is_value=is_zip_code):
+    for n, row in enumerate(csv.reader(f)):
+        row = [value.strip() for value in row]
+        if not row or row[0] == "":
+            continue
+        if n == 0 and not is_value(row[0]):
+            continue
+        yield row
+
+# Проверка, что строка является широтой (для поиска строки заголовка)
+def is_latitude(text):
+    try:
+        parse_coordinate(text, 'lat')
+    except ValueError:
+        return False
+    return True
+
+# Пакетное определение ближайших почтовых индексов для точек: из csv-файла читаются координаты (широта, долгота - в
+# десятичных градусах или в формате to_dms), в выходной csv-файл записываются строки "широта,долгота,индекс,город,штат,
+# округ,расстояние". Для неверных координат поля индекса не заполняются. Возвращает количество точек и количество
+# точек с неверными координатами
+def write_reverse_geocode(columns, source, out):
+    total = 0
+    invalid = 0
+    out.write("latitude,longitude,zip_code,city,state,county,miles\n")
+    points = (row for row in read_batch_rows(source, is_latitude) if len(row) >= 2)
+    while True:
+        chunk = list(islice(points, batch_chunk_size))
+        if not chunk:
+            break
+        coordinates = []
+        for row in chunk:
+            try:
+                coordinates.append((parse_coordinate(row[0], 'lat'), parse_coordinate(row[1], 'lon')))
+            except ValueError:
+                coordinates.append(None)
+        valid = [point for point in coordinates if point is not None]
+        nearest = iter(columns.nearest_rows([lat for lat, lon in valid], [lon for lat, lon in valid]))
+
+        lines = StringIO()
+        table = csv.writer(lines, lineterminator="\n")
+        for row, point in zip(chunk, coordinates):
+            found = None if point is None else next(nearest)
+            if found is None:
+                table.writerow([row[0], row[1], "", "", "", "", ""])
+                invalid += 1
+                continue
+            d, i = found
+            z, lat, lon, city, state, county = columns.row(i)
+            table.writerow([row[0], row[1], z, city, state, county, f"{d:.2f}"])
+        out.write(lines.getvalue())
+        total += len(chunk)
+    return total, invalid
+
+# Номера записей для списка почтовых индексов (-1 для индексов, которых нет в данных; для повторяющихся - последняя запись, как в find_zip)
+def find_zips(columns, zip_codes):
+    if np is None or columns.n == 0:
+        rows = [columns.find_zip(zip_code) for zip_code in zip_codes]
+        return [-1 if i is None else i for i in rows]
+    codes = [zip_to_int(zip_code) for zip_code in zip_codes]
+    codes = np.array([-1 if z is None else z for z in codes], dtype=np.int64)
+    zips = np.frombuffer(columns.zips, dtype=np.uint32)
+    rows = np.maximum(np.searchsorted(zips, codes, side="right") - 1, 0)
+    return np.where(zips[rows] == codes, rows, -1)
+
+# Пакетное вычисление расстояний для пар почтовых индексов: из csv-файла читаются пары (индекс 1, индекс 2), в выходной
+# csv-файл записываются строки "индекс 1,индекс 2,расстояние". Если индекса нет в данных, расстояние не заполняется.
+# Пары обрабатываются частями по batch_chunk_size: индексы ищутся массивом (find_zips), расстояния вычисляются
+# haversine_arrays, строки записываются csv.writer (поля исходного файла с запятыми и кавычками экранируются).
+# Чтение csv.reader, разбор индексов и форматирование строк остаются поэлементными, и скорость ограничена ими, а не
+# расчетом расстояний: около 250-350 тыс. пар в секунду (1 млн пар за 3-4 с, из них около 1.5 с - csv.reader).
+# Возвращает количество пар и количество пар с ненайденными индексами
+def write_distance_pairs(columns, source, out):
+    total = 0
+    missing = 0
+    out.write("zip_code1,zip_code2,miles\n")
+    pairs = (row for row in read_batch_rows(source) if len(row) >= 2)
+    while True:
+        chunk = list(islice(pairs, batch_chunk_size))
+        if not chunk:
+            break
+        rows1 = find_zips(columns, [row[0] for row in chunk])
+        rows2 = find_zips(columns, [row[1] for row in chunk])
+        if np is not None and columns.n > 0:
+            found = (rows1 >= 0) & (rows2 >= 0)
+            lat = np.frombuffer(columns.lat, dtype=np.float64)
+            lon = np.frombuffer(columns.lon, dtype=np.float64)
+            i1 = rows1[found]
+            i2 = rows2[found]
+            distances = iter([f"{d:.2f}" for d in haversine_arrays(lat[i1], lon[i1], lat[i2], lon[i2]).tolist()])
+            found = found.tolist()
+        else:
+            found = [i1 >= 0 and i2 >= 0 for i1, i2 in zip(rows1, rows2)]
+            distances = iter([f"{haversine_miles(columns.lat[i1], columns.lon[i1], columns.lat[i2], columns.lon[i2]):.2f}"
+                              for i1, i2, ok in zip(rows1, rows2, found) if ok])
+        missing += found.count(False)
+        lines = StringIO()
+        table = csv.writer(lines, lineterminator="\n")
+        table.writerows([(row[0], row[1], next(distances) if ok else "") for row, ok in zip(chunk, found)])
+        out.write(lines.getvalue())
+        total += len(chunk)
+    return total, missing
+
+# Пакетное вычисление матрицы расстояний между двумя списками почтовых индексов: в выходной csv-файл записывается
+# строка заголовка с индексами второго списка и по одной строке на каждый индекс первого списка. Индексы, которых нет
+# в данных, в матрицу не попадают. Матрица вычисляется частями по batch_chunk_size расстояний.
+# Возвращает количество вычисленных расстояний и список ненайденных индексов
+def write_distance_matrix(columns, from_zips, to_zips, out):
+    rows1 = find_zips(columns, from_zips)
+    rows2 = find_zips(columns, to_zips)
+    missing = [z for z, i in zip(from_zips, rows1) if i < 0] + [z for z, i in zip(to_zips, rows2) if i < 0]
+    from_zips = [z for z, i in zip(from_zips, rows1) if i >= 0]
+    to_zips = [z for z, i in zip(to_zips, rows2) if i >= 0]
+    rows1 = [i for i in rows1 if i >= 0]
+    rows2 = [i for i in rows2 if i >= 0]
+
+    out.write(",".join(["zip_code"] + to_zips) + "\n")
+    line = ",".join(["%s"] + ["%.2f"] * len(to_zips)) + "\n"
+    step = max(1, batch_chunk_size // max(1, len(to_zips)))
+    if np is not None:
+        lat = np.frombuffer(columns.lat, dtype=np.float64)
+        lon = np.frombuffer(columns.lon, dtype=np.float64)
+        index2 = np.array(rows2, dtype=np.intp)
+        lat2 = lat[index2][None, :]
+        lon2 = lon[index2][None, :]
+    for start in range(0, len(rows1), step):
+        part = rows1[start:start + step]
+        if np is not None:
+            index1 = np.array(part, dtype=np.intp)
+            matrix = haversine_arrays(lat[index1][:, None], lon[index1][:, None], lat2, lon2).tolist()
+        else:
+            matrix = [[haversine_miles(columns.lat[i1], columns.lon[i1], columns.lat[i2], columns.lon[i2]) for i2 in rows2]
+                      for i1 in part]
+        out.write("".join(line % (z, *distances) for z, distances in zip(from_zips[start:start + step], matrix)))
+    return len(rows1) * len(rows2), missing
+
+# Пакетный режим: python pract6.py pairs <файл пар> [<выходной файл>]
+# или python pract6.py matrix <файл индексов 1> <файл индексов 2> [<выходной файл>]
+def batch(columns, args):
+    usage = ("Usage: python pract6.py pairs <pairs.csv> [<output.csv>] | matrix <from.csv> <to.csv> [<output.csv>] | "
+             "reverse <points.csv> [<output.csv>] | serve [<port> | <socket>]")
+    if len(args) < 2 or args[0] not in ("pairs", "matrix", "reverse"):
+        print(usage, file=sys.stderr)
+        return
+    if args[0] == "reverse":
+        output = args[2] if len(args) > 2 else "-"
+        with open_batch_file(args[1], "r") as source, open_batch_file(output, "w") as out:
+            total, invalid = write_reverse_geocode(columns, source, out)
+        print(f"{total} point(s) processed, {invalid} with invalid coordinates", file=sys.stderr)
+        return
+    if args[0] == "pairs":
+        output = args[2] if len(args) > 2 else "-"
+        with open_batch_file(args[1], "r") as source, open_batch_file(output, "w") as out:
+            total, missing = write_distance_pairs(columns, source, out)
+        print(f"{total} pair(s) processed, {missing} with zip code(s) not found", file=sys.stderr)
+        return
+
+    if len(args) < 3:
+        print(usage, file=sys.stderr)
+        return
+    zip_lists = []
+    for filename in args[1:3]:
+        with open_batch_file(filename, "r") as source:
+            zip_lists.append([row[0] for row in read_batch_rows(source)])
+    output = args[3] if len(args) > 3 else "-"
+    with open_batch_file(output, "w") as out:
+        total, missing = write_distance_matrix(columns, zip_lists[0], zip_lists[1], out)
+    print(f"{total} distance(s) computed", file=sys.stderr)
+    if missing:
+        print("Error: zip code(s) not found: " + ", ".join(missing), file=sys.stderr)
+
+# Проверка числа для команд near (количество), city (количество подсказок) и radius (радиус в милях): сообщение об
+# ошибке или None
+def near_value_error(cmd, value):
+    if cmd == "near":
+        return "count must be non-negative" if value < 0 else None
+    if cmd == "city":
+        return "limit must be non-negative" if value < 0 else None
+    if not math.isfinite(value) or value < 0:
+        return "radius must be a finite non-negative number"
+    return None
+
+# count ближайших почтовых индексов к записи i (сама запись не входит): список пар (расстояние, номер записи)
+def near_rows(columns, i, count):
+    error = near_value_error("near", count)
+    if error is not None:
+        raise ValueError(error)
+    # Сама запись тоже находится, поэтому ищется на одну запись больше
+    found = columns.spatial_index().nearest(columns.lat[i], columns.lon[i], count + 1)
+    return [(d, j) for d, j in found if j != i][:count]
+
+# Почтовые индексы не дальше miles миль от записи i (сама запись не входит): список пар (расстояние, номер записи)
+def radius_rows(columns, i, miles):
+    error = near_value_error("radius", miles)
+    if error is not None:
+        raise ValueError(error)
+    return [(d, j) for d, j in columns.spatial_index().radius(columns.lat[i], columns.lon[i], miles) if j != i]
+
+# Подсказки для ответа сервера: список словарей с полями city, state, count
+def suggestions_json(suggestions):
+    return [{"city": city, "state": state, "count": count} for city, state, count in suggestions]
+
+# Ответ на запрос (словарь) в режиме сервера: {"cmd": "loc", "zip": ...}, {"cmd": "zip", "city": ..., "state": ...},
+# {"cmd": "dist", "zip1": ..., "zip2": ...}, {"cmd": "near", "zip": ..., "count": ...}, {"cmd": "radius", "zip": ..., "miles": ...},
+# {"cmd": "city", "name": ..., "state": ... (необязательно), "limit": ... (необязательно)}, {"cmd": "reverse", "lat": ..., "lon": ...},
+# {"cmd": "state", "state": ...}, {"cmd": "county", "state": ..., "county": ... (необязательно)}, {"cmd": "area", "city": ..., "state": ...},
+# {"cmd": "stats"}. Запрос {"cmd": "reload"} выполняет ZipDatabase.query.
+# Поле "id" запроса копируется в ответ. При ошибке ответ содержит поле "error"
+def query(columns, request):
+    response = {}
+    if "id" in request:
+        response["id"] = request["id"]
+    cmd = str(request.get("cmd", "")).lower()
+    try:
+        if cmd == "loc":
+            i = columns.find_zip(str(request["zip"]))
+            if i is None:
+                response["error"] = "zip code not found"
+                return response
+            z, lat, lon, city, state, county = columns.row(i)
+            response.update({
+                "zip_code": z, "city": city, "state": state, "county": county, "latitude": lat, "longitude": lon,
+                "coordinates": f"({to_dms(lat, 'lat')}, {to_dms(lon, 'lon')})"
+            })
+        elif cmd == "zip":
+            rows = columns.find_city_state(city_state_key(str(request["city"]), str(request["state"])))
+            if not rows:
+                response["error"] = "city/state not found"
+                response["suggestions"] = suggestions_json(columns.city_index().suggest(str(request["city"]), str(request["state"])))
+                return response
+            response["zip_codes"] = [columns.zip_code(i) for i in rows]
+        elif cmd == "dist":
+            i1 = columns.find_zip(str(request["zip1"]))
+            i2 = columns.find_zip(str(request["zip2"]))
+            if i1 is None or i2 is None:
+                response["error"] = "zip code not found"
+                return response
+            response["miles"] = columns.distance(i1, i2)
+        elif cmd == "near" or cmd == "radius":
+            i = columns.find_zip(str(request["zip"]))
+            if i is None:
+                response["error"] = "zip code not found"
+                return response
+            value = int(request["count"]) if cmd == "near" else float(request["miles"])
+            error = near_value_error(cmd, value)
+            if error is not None:
+                response["error"] = error
+                return response
+            if cmd == "near":
+                found = near_rows(columns, i, value)
+            else:
+                found = radius_rows(columns, i, value)
+            response["results"] = [{"zip_code": columns.zip_code(j), "miles": d} for d, j in found]
+        elif cmd == "reverse":
+            found = columns.nearest_row(parse_coordinate(str(request["lat"]), 'lat'), parse_coordinate(str(request["lon"]), 'lon'))
+            if found is None:
+                response["error"] = "zip code not found"
+                return response
+            d, i = found
+            z, lat, lon, city, state, county = columns.row(i)
+            response.update({"zip_code": z, "city": city, "state": state, "county": county, "miles": d})
+        elif cmd == "stats":
+            response["commands"] = query_stats.snapshot()
+            response["dist_cache"] = columns.dist_cache.stats()
+            response["skipped_rows"] = columns.skipped
+            response["bad_zip_rows"] = columns.bad_zips
+        elif cmd == "state":
+            summary = columns.group_index().state(str(request["state"]))
+            if summary is None:
+                response["error"] = "state not found"
+                return response
+            response.update(summary)
+        elif cmd == "county":
+            groups = columns.group_index()
+            if request.get("county"):
+                summary = groups.county(str(request["state"]), str(request["county"]))
+                if summary is None:
+                    response["error"] = "county not found"
+                    return response
+                response.update(summary)
+            else:
+                counties = groups.state_county_list(str(request["state"]))
+                if not counties:
+                    response["error"] = "state not found"
+                    return response
+                response["counties"] = counties
+        elif cmd == "area":
+            summary = rows_summary(columns, columns.find_city_state(city_state_key(str(request["city"]), str(request["state"]))))
+            if summary is None:
+                response["error"] = "city/state not found"
+                return response
+            response.update(summary)
+        elif cmd == "city":
+            state = request.get("state")
+            limit = int(request.get("limit", 10))
+            error = near_value_error(cmd, limit)
+            if error is not None:
+                response["error"] = error
+                return response
+            suggestions = columns.city_index().suggest(str(request["name"]), str(state) if state else None, limit)
+            response["suggestions"] = suggestions_json(suggestions)
+        else:
+            response["error"] = "invalid command"
+    except KeyError as e:
+        response["error"] = f"missing field {e.args[0]}"
+    except (TypeError, ValueError):
+        response["error"] = "invalid number" if cmd != "reverse" else "invalid coordinates"
+    return response
+
+# Команды, для которых собирается статистика запросов
+query_commands = ("loc", "zip", "city", "dist", "near", "radius", "reverse", "state", "county", "area")
+
+# Ключ статистики для запроса сервера (None, если у команды нет ключа)
+def request_key(cmd, request):
+    try:
+        if cmd in ("loc", "near", "radius"):
+            return str(request["zip"])
+        if cmd == "state":
+            return str(request["state"]).lower()
+        if cmd == "county":
+            return f"{request.get('county') or '*'}, {request['state']}".lower()
+        if cmd == "zip" or cmd == "area":
+            return f"{request['city']}, {request['state']}".lower()
+        if cmd == "city":
+            return str(request["name"]).lower()
+        if cmd == "dist":
+            return pair_key(str(request["zip1"]), str(request["zip2"]))
+    except KeyError:
+        pass
+    return None
+
+# Ответ на запрос с учётом его в статистике запросов (запросы статистики в статистику не входят)
+def measured_query(columns, request):
+    cmd = str(request.get("cmd", "")).lower()
+    if cmd == "stats":
+        return query(columns, request)
+    with query_stats.measure(cmd if cmd in query_commands else "invalid", request_key(cmd, request)):
+        return query(columns, request)
+
+# Запрос из строки в формате JSON (None, если строка не является запросом)
+def parse_request(line):
+    try:
+        request = json.loads(line)
+    except ValueError:
+        return None
+    return request if isinstance(request, dict) else None
+
+# Ответ сервера на запрос: любая ошибка при выполнении запроса превращается в ответ с полем "error",
+# чтобы один некорректный запрос не обрывал соединение клиента и не останавливал сервер
+def server_response(database, request):
+    if request is None:
+        return {"error": "invalid request"}
+    try:
+        return database.query(request)
+    except Exception as e:
+        response = {"id": request["id"]} if "id" in request else {}
+        response["error"] = f"internal error: {type(e).__name__}: {e}"
+        return response
+
+# Ответ на одну строку запроса в формате JSON (строка ответа в формате JSON с переводом строки)
+def query_line(database, line):
+    response = server_response(database, parse_request(line))
+    return json.dumps(response, ensure_ascii=False) + "\n"
+
+# Интервал проверки изменения csv-файла сервером (в секундах)
+reload_interval = 60
+
+# Обслуживание одного клиента сервера: запросы читаются построчно, ответы отправляются в том же порядке.
+# Перезагрузка данных выполняется в отдельном потоке, чтобы остальные клиенты в это время получали ответы
+async def serve_client(database, reader, writer):
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                # Строка длиннее буфера потока: она отбрасывается, клиент получает ошибку
+                request = None
+            else:
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                request = parse_request(line)
+            if request is not None and str(request.get("cmd", "")).lower() == "reload":
+                response = await loop.run_in_executor(None, server_response, database, request)
+            else:
+                response = server_response(database, request)
+            writer.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+# Сервер на локальном TCP-порту или Unix-сокете; клиенты обслуживаются одновременно
+async def run_server(database, address):
+    handler = lambda reader, writer: serve_client(database, reader, writer)
+    if address.isdigit():
+        server = await asyncio.start_server(handler, "127.0.0.1", int(address))
+    else:
+        server = await asyncio.start_unix_server(handler, address)
+    print(f"Listening on {address}", file=sys.stderr)
+    watcher = asyncio.create_task(watch_changes(database))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        watcher.cancel()
+
+# Периодическая проверка изменения csv-файла и перезагрузка данных (в отдельном потоке)
+async def watch_changes(database):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(reload_interval)
+        try:
+            changes = await loop.run_in_executor(None, database.reload_if_changed)
+        except (OSError, ValueError) as e:
+            print(f"Error: reload failed: {e}", file=sys.stderr)
+            continue
+        if changes is not None:
+            print(f"Reloaded: {changes['inserted']} inserted, {changes['updated']} updated, {changes['deleted']} deleted",
+                  file=sys.stderr)
+
+# Режим сервера: python pract6.py serve - запросы читаются из стандартного ввода, ответы выводятся в стандартный вывод;
+# python pract6.py serve <порт> или python pract6.py serve <путь к сокету> - сервер TCP или Unix-сокета
+def serve(database, args):
+    # Данные и индексы загружаются до первого запроса
+    columns = database.columns()
+    columns.spatial_index()
+    columns.city_index()
+    columns.group_index()
+    if args:
+        try:
+            asyncio.run(run_server(database, args[0]))
+        except KeyboardInterrupt:
+            pass
+        return
+    for line in sys.stdin:
+        if line.strip():
+            sys.stdout.write(query_line(database, line))
+            sys.stdout.flush()
+
+# Номера последних записей для каждого почтового индекса (столбец zips упорядочен; при повторении индекса
+# используется последняя запись, как и при поиске изменений)
+def last_rows(zips):
+    if len(zips) == 0:
+        return zips
+    return np.nonzero(np.append(zips[1:] != zips[:-1], True))[0]
+
+# Количество новых, изменённых и удалённых почтовых индексов в столбцах new по сравнению со столбцами old. Записи
+# сравниваются по почтовому индексу (при повторении индекса - последняя запись); с NumPy - векторно: номера строк
+# таблицы old переводятся в номера строк таблицы new, и столбцы общих индексов сравниваются целиком
+def diff_columns(old, new):
+    if np is None:
+        old_rows = {old.zips[i]: old.row(i) for i in range(old.n)}
+        new_rows = {new.zips[i]: new.row(i) for i in range(new.n)}
+        updated = sum(1 for z, row in new_rows.items() if z in old_rows and row != old_rows[z])
+        common = sum(1 for z in new_rows if z in old_rows)
+        return {"inserted": len(new_rows) - common, "updated": updated, "deleted": len(old_rows) - common}
+
+    old_zips = np.frombuffer(old.zips, dtype=np.uint32)
+    new_zips = np.frombuffer(new.zips, dtype=np.uint32)
+    old_last = last_rows(old_zips)
+    new_last = last_rows(new_zips)
+    common, old_k, new_k = np.intersect1d(old_zips[old_last], new_zips[new_last], assume_unique=True, return_indices=True)
+    i = old_last[old_k]
+    j = new_last[new_k]
+
+    new_strings = {value: k for k, value in enumerate(new.all_strings())}
+    translate = np.array([new_strings.get(value, -1) for value in old.all_strings()], dtype=np.int64)
+    changed = np.zeros(len(common), dtype=bool)
+    for name in ("lat", "lon"):
+        changed |= np.frombuffer(getattr(old, name), dtype=np.float64)[i] != np.frombuffer(getattr(new, name), dtype=np.float64)[j]
+    for name in ("city_ids", "state_ids", "county_ids"):
+        old_ids = translate[np.frombuffer(getattr(old, name), dtype=np.uint32)[i]]
+        changed |= old_ids != np.frombuffer(getattr(new, name), dtype=np.uint32)[j]
+    return {
+        "inserted": len(new_last) - len(common),
+        "updated": int(np.count_nonzero(changed)),
+        "deleted": len(old_last) - len(common)
+    }
+
+# csv-файл с данными по умолчанию (в директории программы)
+default_csv = os.path.join(os.path.dirname(os.path.abspath(__file__)), "zip_codes_states.csv")
+
+# Сведения о записи i: словарь с полями zip_code, city, state, county, latitude, longitude
+def location_dict(columns, i):
+    z, lat, lon, city, state, county = columns.row(i)
+    return {"zip_code": z, "city": city, "state": state, "county": county, "latitude": lat, "longitude": lon}
+
+# База почтовых индексов для использования из других программ. Данные загружаются (из кэша) при первом запросе, а не
+# при создании объекта или импорте модуля. Методы можно вызывать одновременно из нескольких потоков.
+# При перезагрузке csv-файла (reload) новые столбцы строятся рядом со старыми и подменяются одним присваиванием, поэтому
+# каждый запрос, получивший столбцы через columns(), работает с согласованными данными и не ждёт окончания перезагрузки
+class ZipDatabase:
+    def __init__(self, filename=default_csv, cache_file=None):
+        self.filename = filename
+        self.cache_file = cache_file if cache_file is not None else default_cache_file(filename)
+        self.loaded = None
+        # Время изменения, размер и хеш csv-файла, из которого получены загруженные данные
+        self.source = None
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()
+
+    # Данные в виде столбцов (загружаются при первом обращении)
+    def columns(self):
+        columns = self.loaded
+        if columns is None:
+            with self.lock:
+                if self.loaded is None:
+                    self.loaded, self.source = open_cache(self.filename, self.cache_file)
+                columns = self.loaded
+        return columns
+
+    # Перезагрузка csv-файла: файл читается заново (ingest_columns) и сравнивается с загруженными данными по почтовому
+    # индексу. Если данные изменились, новые столбцы подменяют старые; уже использовавшиеся индексы строятся для них заранее,
+    # кэш на диске перезаписывается. Возвращает словарь с количеством новых (inserted), изменённых (updated) и удалённых
+    # (deleted) записей
+    def reload(self):
+        with self.reload_lock:
+            columns = self.columns()
+            stat = os.stat(self.filename)
+            digest = file_hash(self.filename)
+            changes = {"inserted": 0, "updated": 0, "deleted": 0}
+            result = columns
+            if digest != self.source[2]:
+                new_columns = ingest_columns(self.filename)
+                changes = diff_columns(columns, new_columns)
+                if any(changes.values()):
+                    # Индексы, которые уже использовались, строятся до подмены данных, чтобы запросы их не ждали
+                    result = new_columns
+                    if columns.grid is not None:
+                        result.spatial_index()
+                    if columns.cities is not None:
+                        result.city_index()
+                    if columns.groups is not None:
+                        result.group_index()
+                else:
+                    result.skipped = new_columns.skipped
+                    result.bad_zips = new_columns.bad_zips
+
+            # Кэш на диске нужен только для следующего запуска, поэтому ошибка его записи не мешает перезагрузке
+            try:
+                if result is not columns or not touch_cache(self.cache_file, stat, digest):
+                    write_cache(result, self.cache_file, stat, digest)
+            except (OSError, struct.error):
+                pass
+            self.source = (stat.st_mtime_ns, stat.st_size, digest)
+            self.loaded = result
+            return changes
+
+    # Перезагрузка csv-файла, если его время изменения или размер отличаются от загруженного (None, если файл не изменился)
+    def reload_if_changed(self):
+        self.columns()
+        stat = os.stat(self.filename)
+        if (stat.st_mtime_ns, stat.st_size) == self.source[:2]:
+            return None
+        return self.reload()
+
+    # Ответ на запрос в формате сервера (см. query); запрос {"cmd": "reload"} перезагружает csv-файл
+    def query(self, request):
+        if str(request.get("cmd", "")).lower() == "reload":
+            response = {"id": request["id"]} if "id" in request else {}
+            try:
+                response.update(self.reload())
+            except (OSError, ValueError) as e:
+                response["error"] = f"reload failed: {e}"
+            return response
+        return measured_query(self.columns(), request)
+
+    # Сведения о почтовом индексе: словарь с полями zip_code, city, state, county, latitude, longitude (None, если индекс не найден)
+    def location(self, zip_code):
+        columns = self.columns()
+        i = columns.find_zip(zip_code)
+        if i is None:
+            return None
+        return location_dict(columns, i)
+
+    # Почтовые индексы города по возрастанию (пустой список, если город и штат не найдены)
+    def zip_codes(self, city, state):
+        columns = self.columns()
+        return [columns.zip_code(i) for i in columns.find_city_state(city_state_key(city, state))]
+
+    # Расстояние между почтовыми индексами в милях (None, если индекс не найден)
+    def distance(self, zip1, zip2):
+        columns = self.columns()
+        i1 = columns.find_zip(zip1)
+        i2 = columns.find_zip(zip2)
+        if i1 is None or i2 is None:
+            return None
+        return columns.distance(i1, i2)
+
+    # count ближайших почтовых индексов: список пар (индекс, расстояние в милях) (None, если индекс не найден)
+    def nearest(self, zip_code, count):
+        columns = self.columns()
+        i = columns.find_zip(zip_code)
+        if i is None:
+            return None
+        return [(columns.zip_code(j), d) for d, j in near_rows(columns, i, count)]
+
+    # Почтовые индексы не дальше miles миль: список пар (индекс, расстояние в милях) (None, если индекс не найден)
+    def within(self, zip_code, miles):
+        columns = self.columns()
+        i = columns.find_zip(zip_code)
+        if i is None:
+            return None
+        return [(columns.zip_code(j), d) for d, j in radius_rows(columns, i, miles)]
+
+    # Ближайший почтовый индекс к точке (координаты - числа или строки, как в команде reverse): сведения о нём, как
+    # в location, с полем miles (None, если данных нет)
+    def reverse(self, lat, lon):
+        columns = self.columns()
+        if isinstance(lat, str):
+            lat = parse_coordinate(lat, 'lat')
+        if isinstance(lon, str):
+            lon = parse_coordinate(lon, 'lon')
+        found = columns.nearest_row(lat, lon)
+        if found is None:
+            return None
+        d, i = found
+        result = location_dict(columns, i)
+        result["miles"] = d
+        return result
+
+    # Подсказки для названия города: список кортежей (город, штат, количество почтовых индексов)
+    def suggest_cities(self, name, state=None, limit=10):
+        return self.columns().city_index().suggest(name, state, limit)
+
+    # Сводка по штату: словарь с полями state, count, counties (количество округов), centroid ([широта, долгота]) и
+    # bbox ([мин. широта, мин. долгота, макс. широта, макс. долгота]) (None, если штат не найден)
+    def state_summary(self, state):
+        summary = self.columns().group_index().state(state)
+        return None if summary is None else dict(summary)
+
+    # Сводка по округу (поля state, county, count, centroid, bbox; None, если округ не найден), а если округ не указан -
+    # список сводок по всем округам штата
+    def county_summary(self, state, county=None):
+        groups = self.columns().group_index()
+        if county is None:
+            return [dict(summary) for summary in groups.state_county_list(state)]
+        summary = groups.county(state, county)
+        return None if summary is None else dict(summary)
+
+    # Сводка по почтовым индексам города (поля count, centroid, bbox; None, если город и штат не найдены)
+    def city_summary(self, city, state):
+        columns = self.columns()
+        return rows_summary(columns, columns.find_city_state(city_state_key(city, state)))
+
+# Общие объекты ZipDatabase процесса (по имени csv-файла)
+shared_databases = {}
+shared_databases_lock = threading.Lock()
+
+# Общий для всего процесса объект ZipDatabase для csv-файла filename
+def shared_database(filename=default_csv):
+    filename = os.path.abspath(filename)
+    with shared_databases_lock:
+        database = shared_databases.get(filename)
+        if database is None:
+            database = shared_databases[filename] = ZipDatabase(filename)
+        return database
+
 # Основная функция
 
 def main():
 
-    data = read_zip("zip_codes_states.csv")
-
-    by_zip, by_city_state = indexes(data)
+    database = shared_database()
+    if len(sys.argv) > 1:
+        if sys.argv[1] == "serve":
+            serve(database, sys.argv[2:])
+        else:
+            batch(database.columns(), sys.argv[1:])
+        return
+    database.columns()
 
     while True:
-        cmd = input("Command ('loc', 'zip', 'dist', 'end') => ").strip()
+        cmd = input("Command ('loc', 'zip', 'city', 'dist', 'near', 'radius', 'reverse', 'state', 'county', 'area', 'stats', 'reload', 'end') => ").strip()
         print(cmd)
         cmd = cmd.lower()
+        # Данные для команды (после перезагрузки - новые)
+        columns = database.columns()
+        by_zip = ZipIndex(columns)
+        by_city_state = CityStateIndex(columns)
 
         if cmd == "end":
             print("Done")
@@ -125,46 +1879,170 @@ def main():
         elif cmd == "loc":
             zip_code = input("Enter a zip code to lookup => ")
             print(zip_code)
-            if zip_code not in by_zip:
-                print("Error: zip code not found")
-                continue
-            row = by_zip[zip_code]
-            z, lat, lon, city, state, county = row
-            lat_dms = to_dms(lat, 'lat')
-            lon_dms = to_dms(lon, 'lon')
-            print(f"Zip code {z} is in [city], {state}, {county} county, ")
-            print(f"coordinates: ({lat_dms}, {lon_dms})")
+            with query_stats.measure("loc", zip_code):
+                if zip_code not in by_zip:
+                    print("Error: zip code not found")
+                    continue
+                row = by_zip[zip_code]
+                z, lat, lon, city, state, county = row
+                lat_dms = to_dms(lat, 'lat')
+                lon_dms = to_dms(lon, 'lon')
+                print(f"Zip code {z} is in [city], {state}, {county} county, ")
+                print(f"coordinates: ({lat_dms}, {lon_dms})")
 
         elif cmd == "zip":
             city = input("Enter a city name to lookup => ")
             print(city)
             state = input("Enter the state name to lookup => ")
             print(state)
-            key = (city.lower(), state.lower())
-            if key not in by_city_state:
-                print("Error: city/state not found")
-                continue
-            zips = sorted(by_city_state[key])
-            print(f"The following zip code(s) found for {city}, {state}: "+", ".join(zips))
+            with query_stats.measure("zip", f"{city}, {state}".lower()):
+                key = (city.lower(), state.lower())
+                if key not in by_city_state:
+                    print("Error: city/state not found")
+                    suggestions = columns.city_index().suggest(city, state, 5)
+                    if suggestions:
+                        print("Did you mean: " + format_suggestions(suggestions))
+                    continue
+                zips = by_city_state[key]
+                print(f"The following zip code(s) found for {city}, {state}: "+", ".join(zips))
+
+        elif cmd == "city":
+            city = input("Enter a city name or its beginning => ")
+            print(city)
+            state = input("Enter the state name (empty for any state) => ")
+            print(state)
+            with query_stats.measure("city", city.lower()):
+                suggestions = columns.city_index().suggest(city, state)
+                if not suggestions:
+                    print("Error: no matching cities found")
+                    continue
+                print(f"Cities matching {city}: " + format_suggestions(suggestions))
 
         elif cmd == "dist":
             z1 = input("Enter the first zip code => ")
             print(z1)
             z2 = input("Enter the second zip code => ")
             print(z2)
-            if z1 not in by_zip or z2 not in by_zip:
-                print("Error: zip code not found")
+            with query_stats.measure("dist", pair_key(z1, z2)):
+                i1 = columns.find_zip(z1)
+                i2 = columns.find_zip(z2)
+                if i1 is None or i2 is None:
+                    print("Error: zip code not found")
+                    continue
+                d = columns.distance(i1, i2)
+                print(f"The distance between {z1} and {z2} is {d:.2f} miles")
+
+        elif cmd == "near" or cmd == "radius":
+            zip_code = input("Enter a zip code => ")
+            print(zip_code)
+            if cmd == "near":
+                value = input("Enter the number of nearest zip codes => ")
+            else:
+                value = input("Enter the radius in miles => ")
+            print(value)
+            with query_stats.measure(cmd, zip_code):
+                i = columns.find_zip(zip_code)
+                if i is None:
+                    print("Error: zip code not found")
+                    continue
+                try:
+                    value = int(value) if cmd == "near" else float(value)
+                except ValueError:
+                    print("Error: invalid number")
+                    continue
+                error = near_value_error(cmd, value)
+                if error is not None:
+                    print(f"Error: {error}")
+                    continue
+                if cmd == "near":
+                    found = near_rows(columns, i, value)
+                    title = f"The {len(found)} nearest zip code(s) to {zip_code}"
+                else:
+                    found = radius_rows(columns, i, value)
+                    title = f"Zip code(s) within {value:g} miles of {zip_code}"
+                if not found:
+                    print(f"{title}: none")
+                    continue
+                print(f"{title}: " + ", ".join(f"{columns.zip_code(j)} ({d:.2f} miles)" for d, j in found))
+
+        elif cmd == "reverse":
+            lat = input("Enter the latitude => ")
+            print(lat)
+            lon = input("Enter the longitude => ")
+            print(lon)
+            with query_stats.measure("reverse", None):
+                try:
+                    lat = parse_coordinate(lat, 'lat')
+                    lon = parse_coordinate(lon, 'lon')
+                except ValueError:
+                    print("Error: invalid coordinates")
+                    continue
+                found = columns.nearest_row(lat, lon)
+                if found is None:
+                    print("Error: zip code not found")
+                    continue
+                d, i = found
+                z, _, _, city, state, county = columns.row(i)
+                print(f"The nearest zip code to ({to_dms(lat, 'lat')}, {to_dms(lon, 'lon')}) is {z}: {city}, {state}, {county} county, "
+                      f"{d:.2f} miles away")
+
+        elif cmd == "state":
+            state = input("Enter the state name => ")
+            print(state)
+            with query_stats.measure("state", state.lower()):
+                summary = columns.group_index().state(state)
+                if summary is None:
+                    print("Error: state not found")
+                    continue
+                print(f"State {summary['state']}: {summary['counties']} county(ies), " + format_summary(summary))
+
+        elif cmd == "county":
+            state = input("Enter the state name => ")
+            print(state)
+            county = input("Enter the county name (empty for all counties) => ")
+            print(county)
+            with query_stats.measure("county", f"{county or '*'}, {state}".lower()):
+                groups = columns.group_index()
+                if county:
+                    summary = groups.county(state, county)
+                    if summary is None:
+                        print("Error: county not found")
+                        continue
+                    print(f"{summary['county']} county, {summary['state']}: " + format_summary(summary))
+                    continue
+                counties = groups.state_county_list(state)
+                if not counties:
+                    print("Error: state not found")
+                    continue
+                print(f"Zip codes per county in {counties[0]['state']}: " +
+                      ", ".join(f"{summary['county']} ({summary['count']})" for summary in counties))
+
+        elif cmd == "area":
+            city = input("Enter a city name => ")
+            print(city)
+            state = input("Enter the state name => ")
+            print(state)
+            with query_stats.measure("area", f"{city}, {state}".lower()):
+                summary = rows_summary(columns, columns.find_city_state(city_state_key(city, state)))
+                if summary is None:
+                    print("Error: city/state not found")
+                    continue
+                print(f"{city}, {state}: " + format_summary(summary))
+
+        elif cmd == "stats":
+            for line in format_stats(columns):
+                print(line)
+
+        elif cmd == "reload":
+            try:
+                changes = database.reload()
+            except (OSError, ValueError) as e:
+                print(f"Error: reload failed: {e}")
                 continue
-            r1 = by_zip[z1]
-            r2 = by_zip[z2]
-            lat1, lon1 = r1[1], r1[2]
-            lat2, lon2 = r2[1], r2[2]
-            d = haversine_miles(lat1, lon1, lat2, lon2)
-            print(f"The distance between {z1} and {z2} is {d:.2f} miles")
+            print(f"Reloaded: {changes['inserted']} inserted, {changes['updated']} updated, {changes['deleted']} deleted")
 
         else:
             print("Invalid command")
 
-main()
-        
-            
+if __name__ == "__main__":
+    main()